@@ -1,78 +1,563 @@
 ﻿import random
+from bisect import bisect_left
+from collections import deque
+from functools import partial
+from itertools import compress
+from math import factorial
 
-from .board import Board
-from .ui import GRID_SIZE
+from .board import Board, cells_mask, iter_bits, placement_table
+from .config import GRID_SIZE, SHIP_SIZES, BITBOARD_LIMIT
+
+STRATEGIES = ["hunt", "parity", "density", "montecarlo"]
 
 
 class Player:
-    def __init__(self):
-        self.board = Board()
+    def __init__(self, size=GRID_SIZE, fleet=SHIP_SIZES):
+        self.board = Board(size, fleet)
+
+
+class EndgameSolver:
+    # Exact per-cell ship probabilities by enumerating every placement of the
+    # remaining fleet that fits the board. Sub-results are memoized on
+    # (free cells, uncovered hits, remaining sizes); per-cell occupancy counts
+    # are packed into one int, FIELD bits per cell, so summing is one addition.
+    FIELD = 64
+    # (kind, board size, ship size) -> placement data, shared by all solvers.
+    TABLES = {}
+
+    def __init__(self, grid_size, threshold=1000, max_bytes=32 * 1024 * 1024):
+        self.n = grid_size
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.cache = {}
+        self.cache_bytes = 0
+        # Incremental estimate for choose(): the free mask seen last move and,
+        # per ship size, which placements still fit in it and how many.
+        self.free = None
+        self.alive = {}
+        self.fits = {}
+        # Per size, (positions, entries) of the table entries that fit the
+        # current root free mask; the search never looks at any other.
+        self.live = {}
+        # Board state at the last full check and the slack it allowed.
+        self.sunk_seen = None
+        self.logged_seen = 0
+        self.slack = 0
+
+    def table(self, size):
+        # (mask, halo, packed cells) for every placement of a ship of `size`.
+        table = self.TABLES.get(("table", self.n, size))
+        if table is None:
+            table = []
+            for _, mask, halo in placement_table(size, self.n):
+                spread = 0
+                for idx in iter_bits(mask):
+                    spread |= 1 << (self.FIELD * idx)
+                table.append((mask, halo, spread))
+            self.TABLES[("table", self.n, size)] = table
+        return table
+
+    def covers(self, size):
+        # Cell index -> positions in table(size) of the placements covering it.
+        covers = self.TABLES.get(("covers", self.n, size))
+        if covers is None:
+            covers = [[] for _ in range(self.n * self.n)]
+            for pos, (mask, _, _) in enumerate(self.table(size)):
+                for idx in iter_bits(mask):
+                    covers[idx].append(pos)
+            self.TABLES[("covers", self.n, size)] = covers
+        return covers
+
+    def _track(self, free, sizes):
+        # Brings the per-size fit counts up to date with `free`. Cells only
+        # ever leave the free mask during a game, so each move touches just
+        # the placements through the cells that left it; a mask that grew
+        # (new game, different sizes) is counted again from scratch.
+        if self.free is None:
+            # First move of the game: start from an empty board, where every
+            # placement fits, and let the update below remove what is gone.
+            self.free = (1 << (self.n * self.n)) - 1
+            self.alive = {size: bytearray(b"\x01") * len(self.table(size)) for size in set(sizes)}
+            self.fits = {size: len(alive) for size, alive in self.alive.items()}
+        if free & ~self.free or not self.fits.keys() >= set(sizes):
+            self.alive = {}
+            self.fits = {}
+            for size in set(sizes):
+                alive = self._fitting(free, size)
+                self.alive[size] = alive
+                self.fits[size] = alive.count(1)
+        else:
+            gone = list(iter_bits(self.free & ~free))
+            # Sizes no longer afloat never come back; their counts go stale.
+            for size in set(sizes):
+                alive = self.alive[size]
+                covers = self.covers(size)
+                fits = self.fits[size]
+                for idx in gone:
+                    for pos in covers[idx]:
+                        if alive[pos]:
+                            alive[pos] = 0
+                            fits -= 1
+                self.fits[size] = fits
+        self.free = free
+
+    def _fitting(self, free, size):
+        # One flag per table(size) entry: does the placement fit in `free`?
+        return bytearray(not mask & ~free for mask, _, _ in self.table(size))
+
+    def _restrict(self, alive):
+        self.live = {}
+        for size, flags in alive.items():
+            table = self.table(size)
+            self.live[size] = (list(compress(range(len(table)), flags)), list(compress(table, flags)))
+
+    def _bound(self, fits, sizes):
+        total = 1
+        for size in set(sizes):
+            k = sizes.count(size)
+            total *= fits[size] ** k // factorial(k)
+            if total > self.threshold:
+                break
+        return total
+
+    def estimate(self, free, sizes):
+        # Upper bound on configurations: independent placements per ship.
+        fits = {size: self._fitting(free, size).count(1) for size in set(sizes)}
+        return self._bound(fits, sizes)
+
+    def probabilities(self, free, hits, sizes):
+        # Returns (configurations, packed occupancy); None above the threshold.
+        sizes = tuple(sorted(sizes, reverse=True))
+        if self.estimate(free, sizes) > self.threshold:
+            return None
+        self._restrict({size: self._fitting(free, size) for size in set(sizes)})
+        return self._solve(free, hits, sizes)
+
+    def _remember(self, key, value):
+        size = value[1].bit_length() // 8 + 100
+        if self.cache_bytes + size > self.max_bytes:
+            # Hard cap: drop everything rather than grow past it.
+            self.cache.clear()
+            self.cache_bytes = 0
+        self.cache[key] = value
+        self.cache_bytes += size
+        return value
+
+    def _solve(self, free, hits, sizes):
+        key = (free, hits, sizes)
+        found = self.cache.get(key)
+        if found is not None:
+            return found
+        if not hits:
+            if not sizes:
+                return 1, 0
+            return self._place_free(free, sizes)
+
+        # The lowest uncovered hit belongs to exactly one ship: branch on it.
+        low = (hits & -hits).bit_length() - 1
+        total = 0
+        occ = 0
+        for size in sorted(set(sizes), reverse=True):
+            rest = list(sizes)
+            rest.remove(size)
+            rest = tuple(rest)
+            table = self.table(size)
+            for pos in self.covers(size)[low]:
+                mask, halo, spread = table[pos]
+                if mask & ~free or (hits & ~mask) & halo:
+                    continue
+                count, sub = self._solve(free & ~halo, hits & ~mask, rest)
+                if count:
+                    total += count
+                    occ += count * spread + sub
+        return self._remember(key, (total, occ))
+
+    def _place_free(self, free, sizes, start=0):
+        # Ships of one size are placed in increasing table order, so each set
+        # of identical ships is counted once. The last ship is summed inline.
+        key = (free, sizes, start)
+        found = self.cache.get(key)
+        if found is not None:
+            return found
+        total = 0
+        occ = 0
+        positions, entries = self.live[sizes[0]]
+        first = bisect_left(positions, start)
+        rest = sizes[1:]
+        if not rest:
+            for mask, _, spread in entries[first:]:
+                if not mask & ~free:
+                    total += 1
+                    occ += spread
+            return self._remember(key, (total, occ))
+        same = rest[0] == sizes[0]
+        for i in range(first, len(entries)):
+            mask, halo, spread = entries[i]
+            if mask & ~free:
+                continue
+            count, sub = self._place_free(free & ~halo, rest, positions[i] + 1 if same else 0)
+            if count:
+                total += count
+                occ += count * spread + sub
+        return self._remember(key, (total, occ))
+
+    def _slack(self, sizes):
+        # How many more cells may leave the free mask while the bound surely
+        # stays over the threshold: each one removes at most 2 * size
+        # placements of every size (1 for single cells).
+        terms = []
+        for size in set(sizes):
+            k = sizes.count(size)
+            terms.append((self.fits[size], 2 * size if size > 1 else 1, k, factorial(k)))
+
+        def bound_after(gone):
+            total = 1
+            for fits, per_cell, k, repeats in terms:
+                total *= max(0, fits - gone * per_cell) ** k // repeats
+                if total > self.threshold:
+                    break
+            return total
+
+        # Gallop up from 0: the slack is usually a handful of cells.
+        lo, hi = 0, 1
+        while hi < self.n * self.n and bound_after(hi) > self.threshold:
+            lo, hi = hi, hi * 2
+        hi -= 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if bound_after(mid) > self.threshold:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def choose(self, ai, enemy_board):
+        # Called every move, so the common case is O(1): until a ship sinks,
+        # only logged shots take cells out of the free mask, and fewer of them
+        # than the slack cannot bring the estimate under the threshold.
+        logged = len(enemy_board.shot_log)
+        if len(ai.sunk) == self.sunk_seen and 0 <= logged - self.logged_seen <= self.slack:
+            return None
+        n = self.n
+        sunk = cells_mask(ai.sunk, n)
+        hits = enemy_board.hit_mask & ~sunk
+        free = ((1 << (n * n)) - 1) & ~(enemy_board.shot_mask & ~hits)
+        sizes = tuple(sorted((size for size, count in ai.remaining.items() for _ in range(count)), reverse=True))
+        if not sizes:
+            return None
+        self._track(free, sizes)
+        if self._bound(self.fits, sizes) > self.threshold:
+            self.sunk_seen = len(ai.sunk)
+            self.logged_seen = logged
+            self.slack = self._slack(sizes)
+            return None
+        self._restrict({size: self.alive[size] for size in set(sizes)})
+        solved = self._solve(free, hits, sizes)
+        if not solved[0]:
+            return None
+        _, occ = solved
+        field = (1 << self.FIELD) - 1
+        best = 0
+        cells = []
+        for idx in iter_bits(free & ~hits):
+            c = (occ >> (self.FIELD * idx)) & field
+            if c > best:
+                best = c
+                cells = []
+            if c == best and c:
+                cells.append(idx)
+        if not cells:
+            return None
+        idx = random.choice(cells)
+        return idx % n, idx // n
 
 
 class AIPlayer(Player):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, strategy="hunt", size=GRID_SIZE, fleet=SHIP_SIZES, endgame=True):
+        super().__init__(size, fleet)
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown AI strategy: {strategy}")
+        # Exact solver once few placements remain; needs bitboards.
+        self.endgame = EndgameSolver(size) if endgame and size <= BITBOARD_LIMIT else None
+        self.density_map = None
+        if strategy == "density":
+            # NumPy is imported only when a density player is created.
+            try:
+                from .density import density_map
+            except ImportError:
+                raise RuntimeError("The density strategy requires numpy") from None
+            self.density_map = density_map
+        # Cached opening priors (game.heatmap), shared between processes. Only
+        # an existing file is used; without one the counts start from scratch.
+        self.priors = None
+        if strategy == "density" and size <= BITBOARD_LIMIT:
+            from .heatmap import load_priors
+
+            self.priors = load_priors(size, fleet)
+        self.sampler = None
+        if strategy == "montecarlo":
+            if size > BITBOARD_LIMIT:
+                raise ValueError(f"The montecarlo strategy supports boards up to {BITBOARD_LIMIT}x{BITBOARD_LIMIT}")
+            from .montecarlo import MonteCarloSampler
+
+            self.sampler = MonteCarloSampler()
+            # Rounds of sampling per move when thinking with a time budget.
+            self.max_rounds = 8
+        self.strategy = strategy
         self.mode = "search"
-        self.target_queue = []
-        self.current_hits = []
+        # Target mode: candidate cells in firing order, plus cell -> wound id
+        # for the ones still valid (stale deque entries are skipped lazily).
+        self.target_queue = deque()
+        self.queued = {}
+        # Wounded (hit, not sunk) ships as id -> [x0, y0, x1, y1, hits].
+        self.wounds = {}
+        self.wound_of = {}
+        self.wound_targets = {}
+        self.next_wound = 0
+        # Surviving enemy ships as size -> count.
+        self.remaining = {}
+        for ship_size in fleet:
+            self.remaining[ship_size] = self.remaining.get(ship_size, 0) + 1
+        self.sunk = set()
 
     def choose_shot(self, enemy_board):
-        if self.mode == "target":
-            while self.target_queue and enemy_board.shots[self.target_queue[0][1]][self.target_queue[0][0]] != 0:
-                self.target_queue.pop(0)
-            if not self.target_queue:
-                self.mode = "search"
-                self.current_hits = []
-
-        if self.mode == "target" and self.target_queue:
-            return self.target_queue.pop(0)
-
-        candidates = [(x, y) for y in range(GRID_SIZE) for x in range(GRID_SIZE) if enemy_board.shots[y][x] == 0]
-        if not candidates:
-            return None
-        return random.choice(candidates)
+        if self.endgame is not None:
+            shot = self.endgame.choose(self, enemy_board)
+            if shot is not None:
+                return shot
+        if self.strategy == "density":
+            return self._choose_density(enemy_board)
+        if self.strategy == "montecarlo":
+            shot = self._best_sampled(self._sample(enemy_board), enemy_board)
+            if shot is not None:
+                return shot
+        return self._queued_shot(enemy_board)
+
+    def _queued_shot(self, enemy_board):
+        # Heuristic tail of choose_shot(): finish wounded ships, else search.
+        while self.target_queue:
+            cell = self.target_queue.popleft()
+            if self.queued.pop(cell, None) is None:
+                continue
+            if enemy_board.shots[cell[1]][cell[0]] == 0:
+                return cell
+        self.mode = "target" if self.wounds else "search"
+        return self._search_shot(enemy_board, self.strategy == "parity")
+
+    def _search_shot(self, enemy_board, parity):
+        if parity and not self.remaining.get(1):
+            # Every remaining ship covers a cell of each colour, so one colour suffices.
+            shot = enemy_board.random_unshot(parity=0)
+            if shot is not None:
+                return shot
+        return enemy_board.random_unshot()
+
+    def iter_shots(self, enemy_board, should_stop=None):
+        # Anytime interface for the threaded runner: yields progressively
+        # better shots and checks should_stop() between refinements. The
+        # heuristic strategies decide in one step; Monte Carlo refines its
+        # estimate with every round of samples.
+        # The order is choose_shot()'s: exact endgame, sampler, target queue.
+        if self.strategy != "montecarlo":
+            yield self.choose_shot(enemy_board)
+            return
+        if self.endgame is not None:
+            shot = self.endgame.choose(self, enemy_board)
+            if shot is not None:
+                yield shot
+                return
+        total = None
+        for _ in range(self.max_rounds):
+            counts = self._sample(enemy_board)
+            if counts is None:
+                # The sampler gave up; keep the estimate of earlier rounds.
+                break
+            total = counts if total is None else [a + b for a, b in zip(total, counts)]
+            shot = self._best_sampled(total, enemy_board)
+            if shot is None:
+                break
+            yield shot
+            if should_stop is not None and should_stop():
+                return
+        if total is None or self._best_sampled(total, enemy_board) is None:
+            yield self._queued_shot(enemy_board)
 
     def process_result(self, coord, result, enemy_board):
         if result == "hit":
             self.mode = "target"
-            self.current_hits.append(coord)
-            self._update_targets(enemy_board)
+            self._add_hit(coord, enemy_board)
         elif result == "sunk":
-            self.mode = "search"
-            self.target_queue = []
-            self.current_hits = []
+            for cell in self._record_sunk(coord, enemy_board):
+                wound = self.wound_of.pop(cell, None)
+                if wound is not None:
+                    self._drop_wound(wound)
+            self.mode = "target" if self.wounds else "search"
 
-    def _update_targets(self, enemy_board):
-        if not self.current_hits:
-            return
+    def _add_hit(self, coord, enemy_board):
+        x, y = coord
+        touching = {self.wound_of[c] for c in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)] if c in self.wound_of}
+        if touching:
+            wound = min(touching)
+            bounds = self.wounds[wound]
+            for other in touching - {wound}:
+                # Merge runs that turn out to be one ship.
+                ox0, oy0, ox1, oy1, ohits = self.wounds[other]
+                bounds[0], bounds[1] = min(bounds[0], ox0), min(bounds[1], oy0)
+                bounds[2], bounds[3] = max(bounds[2], ox1), max(bounds[3], oy1)
+                bounds[4] += ohits
+                for cell in [c for c, w in self.wound_of.items() if w == other]:
+                    self.wound_of[cell] = wound
+                self._drop_wound(other)
+            bounds[0], bounds[1] = min(bounds[0], x), min(bounds[1], y)
+            bounds[2], bounds[3] = max(bounds[2], x), max(bounds[3], y)
+            bounds[4] += 1
+        else:
+            wound = self.next_wound
+            self.next_wound += 1
+            self.wounds[wound] = [x, y, x, y, 1]
+            self.wound_targets[wound] = set()
+        self.wound_of[coord] = wound
+        self._update_targets(wound, enemy_board)
 
-        if len(self.current_hits) == 1:
-            x, y = self.current_hits[0]
-            neighbors = [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
-            for nx, ny in neighbors:
-                if enemy_board.in_bounds(nx, ny) and enemy_board.shots[ny][nx] == 0:
-                    if (nx, ny) not in self.target_queue:
-                        self.target_queue.append((nx, ny))
-            return
+    def _drop_wound(self, wound):
+        self.wounds.pop(wound, None)
+        for cell in self.wound_targets.pop(wound, ()):
+            if self.queued.get(cell) == wound:
+                del self.queued[cell]
+
+    def _record_sunk(self, coord, enemy_board):
+        # Ships never touch, so the connected run of hits is the sunk ship.
+        stack = [coord]
+        ship = []
+        while stack:
+            x, y = stack.pop()
+            if not enemy_board.in_bounds(x, y) or (x, y) in self.sunk or enemy_board.shots[y][x] != 2:
+                continue
+            self.sunk.add((x, y))
+            stack.extend([(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)])
+            ship.append((x, y))
+        size = len(ship)
+        if self.remaining.get(size):
+            self.remaining[size] -= 1
+            if not self.remaining[size]:
+                del self.remaining[size]
+        return ship
+
+    def _choose_density(self, enemy_board):
+        if self.priors is not None and not self.wounds and not self.sunk:
+            # Only misses so far: use the sampled prior for this opening.
+            prior = self.priors.lookup(enemy_board.shot_log)
+            if prior is not None:
+                return self._best_prior(prior, enemy_board)
+        n = enemy_board.size
+        window = None
+        if not enemy_board.bitboard:
+            # A full map costs O(cells) per move, far too slow on big boards.
+            # Searching falls back to parity; targeting counts only the box a
+            # ship through the oldest wound (and its halo) can reach.
+            if not self.wounds:
+                return self._search_shot(enemy_board, True)
+            x0, y0, x1, y1, _ = self.wounds[min(self.wounds)]
+            reach = max(self.remaining, default=1)
+            window = (max(0, x0 - reach), max(0, y0 - reach), min(n, x1 + reach + 1), min(n, y1 + reach + 1))
+        counts = self.density_map(enemy_board.shots, self.sunk, self.remaining, n, window)
+        best = counts.max()
+        if best < 0:
+            return None if window is None else self._search_shot(enemy_board, True)
+        ys, xs = (counts == best).nonzero()
+        i = random.randrange(len(xs))
+        if window is not None:
+            return int(xs[i]) + window[0], int(ys[i]) + window[1]
+        return int(xs[i]), int(ys[i])
+
+    def _best_prior(self, prior, enemy_board):
+        best = -1.0
+        choices = []
+        for y, row in enumerate(enemy_board.shots):
+            for x, shot in enumerate(row):
+                if shot:
+                    continue
+                p = prior[y, x]
+                if p > best:
+                    best = p
+                    choices = [(x, y)]
+                elif p == best:
+                    choices.append((x, y))
+        return random.choice(choices) if choices else None
+
+    def _sample(self, enemy_board):
+        n = enemy_board.size
+        sunk = cells_mask(self.sunk, n)
+        hits = enemy_board.hit_mask & ~sunk
+        # Misses (including marked halos) and sunk ships cannot hold a ship.
+        forbidden = (enemy_board.shot_mask & ~enemy_board.hit_mask) | sunk
+        remaining = [size for size, count in self.remaining.items() for _ in range(count)]
+        counts, done = self.sampler.counts(n, forbidden, hits, remaining)
+        return counts if done else None
+
+    def _best_sampled(self, counts, enemy_board):
+        # The unshot cell covered by a ship in most samples; ties at random.
+        if counts is None:
+            return None
+        n = enemy_board.size
+        best = 0
+        cells = []
+        for idx, c in enumerate(counts):
+            if c < best or not c or enemy_board.shots[idx // n][idx % n]:
+                continue
+            if c > best:
+                best = c
+                cells = []
+            cells.append(idx)
+        if not cells:
+            return None
+        idx = random.choice(cells)
+        return idx % n, idx // n
+
+    def _update_targets(self, wound, enemy_board):
+        x0, y0, x1, y1, hits = self.wounds[wound]
+        if hits == 1:
+            candidates = [(x0 + 1, y0), (x0 - 1, y0), (x0, y0 + 1), (x0, y0 - 1)]
+        elif x0 == x1:
+            candidates = [(x0, y0 - 1), (x0, y1 + 1)]
+        else:
+            candidates = [(x0 - 1, y0), (x1 + 1, y0)]
+        candidates = [c for c in candidates if enemy_board.in_bounds(*c) and enemy_board.shots[c[1]][c[0]] == 0]
 
-        xs = {c[0] for c in self.current_hits}
-        ys = {c[1] for c in self.current_hits}
         # Once orientation is known, discard stale perpendicular candidates.
-        self.target_queue = []
-        if len(xs) == 1:
-            x = next(iter(xs))
-            min_y = min(ys)
-            max_y = max(ys)
-            for ny in [min_y - 1, max_y + 1]:
-                if enemy_board.in_bounds(x, ny) and enemy_board.shots[ny][x] == 0:
-                    if (x, ny) not in self.target_queue:
-                        self.target_queue.append((x, ny))
-        elif len(ys) == 1:
-            y = next(iter(ys))
-            min_x = min(xs)
-            max_x = max(xs)
-            for nx in [min_x - 1, max_x + 1]:
-                if enemy_board.in_bounds(nx, y) and enemy_board.shots[y][nx] == 0:
-                    if (nx, y) not in self.target_queue:
-                        self.target_queue.append((nx, y))
+        for cell in self.wound_targets[wound].difference(candidates):
+            if self.queued.get(cell) == wound:
+                del self.queued[cell]
+        for cell in candidates:
+            if cell not in self.queued:
+                self.queued[cell] = wound
+                if hits == 1:
+                    self.target_queue.append(cell)
+                else:
+                    self.target_queue.appendleft(cell)
+        self.wound_targets[wound] = set(candidates)
+
+
+# Name -> factory(size, fleet) returning a player with a board, choose_shot
+# and process_result. The tournament and simulations build players from it;
+# other modules can register their own strategies on import.
+PLAYER_FACTORIES = {}
+
+
+def register_player(name, factory):
+    if name in PLAYER_FACTORIES:
+        raise ValueError(f"AI player already registered: {name}")
+    PLAYER_FACTORIES[name] = factory
+
+
+def create_player(name, size=GRID_SIZE, fleet=SHIP_SIZES):
+    factory = PLAYER_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown AI player: {name}")
+    return factory(size, fleet)
+
 
+for _strategy in STRATEGIES:
+    register_player(_strategy, partial(AIPlayer, _strategy))
+    # Same search without the exact endgame solver, for comparison.
+    register_player(f"{_strategy}-noendgame", partial(AIPlayer, _strategy, endgame=False))
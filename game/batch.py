@@ -0,0 +1,338 @@
+﻿import argparse
+import random
+
+import numpy as np
+
+from .board import check_fleet, iter_bits, placement_table, random_fleet
+from .config import GRID_SIZE, BITBOARD_LIMIT, default_fleet, parse_fleet
+from .density import density_counts
+from .fleetpool import FleetPoolError, shared_pool
+from .sim import SimStats, chunk_sizes, print_report, run_jobs, write_result
+
+# Result codes, as in game.replay.RESULTS.
+MISS, HIT, SUNK, REPEAT = 0, 1, 2, 3
+BATCH_STRATEGIES = ["hunt", "parity", "density"]
+
+
+def _placement_arrays(ship_size, grid_size):
+    # placement_table as (cells, halo) boolean matrices, one row per placement.
+    table = placement_table(ship_size, grid_size)
+    cells = np.zeros((len(table), grid_size * grid_size), dtype=bool)
+    halo = np.zeros_like(cells)
+    for i, (_, mask, halo_bits) in enumerate(table):
+        cells[i, list(iter_bits(mask))] = True
+        halo[i, list(iter_bits(halo_bits))] = True
+    return cells, halo
+
+
+class BatchBoards:
+    # N boards of one size and fleet as stacked arrays, shot in lockstep with
+    # the same rules as Board.shoot and Board._mark_around_sunk.
+    def __init__(self, count, size=GRID_SIZE, fleet=None, rng=None):
+        self.count = count
+        self.size = size
+        self.fleet = list(fleet) if fleet else default_fleet(size)
+        self.ship_len = np.array(self.fleet, dtype=np.int16)
+        # Ship index per cell (-1 for water), shot state 0/1/2 as in Board.shots.
+        self.ship_id = np.full((count, size, size), -1, dtype=np.int16)
+        self.shots = np.zeros((count, size, size), dtype=np.uint8)
+        self.ship_hits = np.zeros((count, len(self.fleet)), dtype=np.int16)
+        self.sunk_count = np.zeros(count, dtype=np.int16)
+        # Cells of sunk ships, which the game reveals to the shooter.
+        self.sunk = np.zeros((count, size, size), dtype=bool)
+        if rng is not None:
+            self.place_random(rng)
+
+    def place(self, fleets):
+        # fleets: one random_fleet() result per board, ships in fleet order.
+        games, ys, xs, ids = [], [], [], []
+        for g, fleet in enumerate(fleets):
+            for k, (cells, _, _) in enumerate(fleet):
+                for x, y in cells:
+                    games.append(g)
+                    ys.append(y)
+                    xs.append(x)
+                    ids.append(k)
+        self.ship_id.fill(-1)
+        self.ship_id[games, ys, xs] = ids
+        self.clear_shots()
+
+    def place_random(self, rng):
+        # Same distribution as board.random_fleet, drawn for every board at
+        # once: each ship is uniform over the placements still legal and a
+        # board that dead-ends is redrawn.
+        n = self.size
+        if n > BITBOARD_LIMIT:
+            seeded = random.Random(int(rng.integers(1 << 62)))
+            self.place([random_fleet(self.fleet, seeded, n) for _ in range(self.count)])
+            return
+        tables = {size: _placement_arrays(size, n) for size in set(self.fleet)}
+        todo = np.arange(self.count)
+        while len(todo):
+            m = len(todo)
+            blocked = np.zeros((m, n * n), dtype=np.float32)
+            ids = np.full((m, n * n), -1, dtype=np.int16)
+            ok = np.ones(m, dtype=bool)
+            for k, size in enumerate(self.fleet):
+                cells, halo = tables[size]
+                clash = blocked @ cells.T.astype(np.float32)
+                weight = np.where(clash == 0, rng.random(clash.shape, dtype=np.float32), -1.0)
+                pick = weight.argmax(axis=1)
+                ok &= weight[np.arange(m), pick] >= 0
+                ids[cells[pick]] = k
+                blocked[halo[pick]] = 1.0
+            self.ship_id[todo[ok]] = ids[ok].reshape(-1, n, n)
+            todo = todo[~ok]
+        self.clear_shots()
+
+    def place_pool(self, pool, rng):
+        # Fleets drawn from a game.fleetpool pool, each under a random board
+        # symmetry, without per-board Python work.
+        if pool.size != self.size or pool.fleet != self.fleet:
+            raise ValueError("fleet pool does not match the board size and fleet")
+        n = self.size
+        m = n - 1
+        words = np.frombuffer(pool.words, dtype=np.uint32).reshape(-1, len(pool.fleet))
+        words = words[rng.integers(0, len(words), self.count)]
+        t = rng.integers(0, 8, self.count)
+        games = np.arange(self.count)
+        self.ship_id.fill(-1)
+        for k, length in enumerate(self.fleet):
+            cell = (words[:, k] >> 1).astype(np.intp)
+            horizontal = (words[:, k] & 1).astype(np.intp)
+            x0 = cell % n
+            y0 = cell // n
+            for i in range(length):
+                x = x0 + i * horizontal
+                y = y0 + i * (1 - horizontal)
+                x, y = np.where(t & 4, y, x), np.where(t & 4, x, y)
+                x = np.where(t & 1, m - x, x)
+                y = np.where(t & 2, m - y, y)
+                self.ship_id[games, y, x] = k
+        self.clear_shots()
+
+    def clear_shots(self):
+        self.shots.fill(0)
+        self.ship_hits.fill(0)
+        self.sunk_count.fill(0)
+        self.sunk.fill(False)
+
+    @classmethod
+    def from_boards(cls, boards):
+        batch = cls(len(boards), boards[0].size, boards[0].fleet, rng=None)
+        batch.place([[(ship.cells, None, None) for ship in board.ships] for board in boards])
+        return batch
+
+    def shoot(self, xs, ys, rows=None):
+        # One shot per listed board; returns result codes for those boards.
+        rows = np.arange(self.count) if rows is None else np.asarray(rows)
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        n = self.size
+        result = np.full(len(rows), REPEAT, dtype=np.int8)
+        inside = (xs >= 0) & (xs < n) & (ys >= 0) & (ys < n)
+        fresh = inside.copy()
+        fresh[inside] = self.shots[rows[inside], ys[inside], xs[inside]] == 0
+
+        r, x, y = rows[fresh], xs[fresh], ys[fresh]
+        sid = self.ship_id[r, y, x]
+        water = sid < 0
+        self.shots[r, y, x] = np.where(water, 1, 2)
+        res = np.where(water, MISS, HIT).astype(np.int8)
+
+        hit = ~water
+        hr, hs = r[hit], sid[hit]
+        # Each board takes one shot per call, so (board, ship) pairs are unique.
+        self.ship_hits[hr, hs] += 1
+        sunk = self.ship_hits[hr, hs] == self.ship_len[hs]
+        if sunk.any():
+            self.sunk_count[hr[sunk]] += 1
+            self._mark_around_sunk(hr[sunk], hs[sunk])
+            res_hit = res[hit]
+            res_hit[sunk] = SUNK
+            res[hit] = res_hit
+        result[fresh] = res
+        return result
+
+    def _mark_around_sunk(self, rows, ships):
+        n = self.size
+        cells = self.ship_id[rows] == ships[:, None, None]
+        padded = np.pad(cells, ((0, 0), (1, 1), (1, 1)))
+        halo = np.zeros_like(cells)
+        for dy in range(3):
+            for dx in range(3):
+                halo |= padded[:, dy : dy + n, dx : dx + n]
+        shots = self.shots[rows]
+        shots[halo & (shots == 0)] = 1
+        self.shots[rows] = shots
+        self.sunk[rows] |= cells
+
+    def all_sunk(self):
+        return self.sunk_count == len(self.fleet)
+
+    def remaining(self, rows):
+        # Surviving ships per board as {size: counts array}.
+        alive = self.ship_hits[rows] < self.ship_len
+        out = {}
+        for size in sorted(set(self.fleet)):
+            out[size] = alive[:, self.ship_len == size].sum(axis=1)
+        return out
+
+
+def _neighbours(a):
+    # Views of a zero-padded stack: (left, right, up, down) neighbour of each cell.
+    p = np.pad(a, ((0, 0), (1, 1), (1, 1)))
+    return p[:, 1:-1, :-2], p[:, 1:-1, 2:], p[:, :-2, 1:-1], p[:, 2:, 1:-1]
+
+
+class BatchAI:
+    # Vectorised counterparts of the AIPlayer strategies: every choice is the
+    # argmax of a per-cell score with random tie-breaking. Hunt and parity fire
+    # next to open hits first (along the line once two hits show it), density
+    # uses the same placement counts as game.density.
+    def __init__(self, strategy="hunt", rng=None):
+        if strategy not in BATCH_STRATEGIES:
+            raise ValueError(f"Strategy {strategy!r} has no batched form")
+        self.strategy = strategy
+        self.rng = rng or np.random.default_rng()
+
+    def choose(self, boards, rows):
+        shots = boards.shots[rows]
+        n = boards.size
+        sunk = boards.sunk[rows]
+        wounded = (shots == 2) & ~sunk
+        # Every score gets a uniform fraction below 1 that never outweighs a
+        # real difference, so ties break uniformly.
+        noise = self.rng.random(shots.shape)
+
+        if self.strategy == "density":
+            remaining = boards.remaining(rows)
+            targeting = wounded.any(axis=(1, 2))[:, None, None]
+            blocked = ((shots == 1) | sunk).astype(np.int32)
+            counts = density_counts(
+                blocked,
+                wounded.astype(np.int32),
+                [(size, c[:, None, None]) for size, c in remaining.items() if c.any()],
+                targeting,
+            )
+            score = counts + noise
+        else:
+            left, right, up, down = _neighbours(wounded)
+            horizontal = wounded & (left | right)
+            vertical = wounded & (up | down)
+            # A cell next to a hit is a candidate unless the hit's ship is known
+            # to run the other way; cells extending a line of hits come first.
+            across = _neighbours(wounded & ~vertical)
+            along = _neighbours(wounded & ~horizontal)
+            target = across[0] | across[1] | along[2] | along[3]
+            h = _neighbours(horizontal)
+            v = _neighbours(vertical)
+            line = h[0] | h[1] | v[2] | v[3]
+            score = noise + 4 * target + 4 * line
+            if self.strategy == "parity":
+                # One colour suffices once no single-cell ships remain.
+                singles = boards.remaining(rows).get(1)
+                colour = (np.add.outer(np.arange(n), np.arange(n)) % 2 == 0)[None]
+                use = np.ones(len(rows), dtype=bool) if singles is None else singles == 0
+                score += 2 * (colour & use[:, None, None])
+
+        score[shots != 0] = -1
+        flat = score.reshape(len(rows), -1).argmax(axis=1)
+        ys, xs = np.divmod(flat, n)
+        return xs, ys
+
+
+def play_batch(games, strategy="hunt", size=GRID_SIZE, fleet=None, seed=0, fleet_pool=None):
+    # AI vs AI in lockstep; same statistics as game.sim.
+    nprng = np.random.default_rng(seed)
+    if fleet_pool:
+        pool = shared_pool(fleet_pool)
+        boards = [BatchBoards(games, size, pool.fleet, None), BatchBoards(games, size, pool.fleet, None)]
+        for board in boards:
+            board.place_pool(pool, nprng)
+    else:
+        boards = [BatchBoards(games, size, fleet, nprng), BatchBoards(games, size, fleet, nprng)]
+    ai = BatchAI(strategy, nprng)
+    first = nprng.integers(0, 2, games)
+    turn = first.copy()
+    shots = np.zeros((2, games), dtype=np.int32)
+    winner = np.full(games, -1)
+    active = np.ones(games, dtype=bool)
+    while active.any():
+        for me in (0, 1):
+            rows = np.nonzero(active & (turn == me))[0]
+            if not len(rows):
+                continue
+            target = boards[1 - me]
+            xs, ys = ai.choose(target, rows)
+            result = target.shoot(xs, ys, rows)
+            shots[me, rows] += 1
+            won = target.all_sunk()[rows]
+            winner[rows[won]] = me
+            active[rows[won]] = False
+            turn[rows[result == MISS]] = 1 - me
+
+    stats = SimStats()
+    stats.games = games
+    stats.first_wins = int((winner == first).sum())
+    values, counts = np.unique(shots[winner, np.arange(games)], return_counts=True)
+    stats.shots_hist = {int(v): int(c) for v, c in zip(values, counts)}
+    return stats
+
+
+def run_chunk(args):
+    return play_batch(*args)
+
+
+def run(
+    games, batch=10000, workers=None, seed=0, strategy="hunt", size=GRID_SIZE, fleet=None, report=None, fleet_pool=None
+):
+    jobs = [
+        (count, strategy, size, fleet, seed + index, fleet_pool)
+        for index, count in enumerate(chunk_sizes(games, batch))
+    ]
+    return run_jobs(run_chunk, jobs, workers, report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lockstep NumPy AI vs AI simulation")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=10000, help="boards per lockstep batch")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strategy", choices=BATCH_STRATEGIES, default="hunt")
+    parser.add_argument("--size", type=int, default=GRID_SIZE)
+    parser.add_argument("--fleet", type=parse_fleet, default=None)
+    parser.add_argument("--fleet-pool", default=None, help="draw placements from a game.fleetpool file")
+    parser.add_argument("--json", dest="json_path", default=None)
+    args = parser.parse_args(argv)
+
+    fleet = args.fleet or default_fleet(args.size)
+    try:
+        check_fleet(fleet, args.size)
+    except ValueError as e:
+        parser.error(f"--fleet: {e}")
+    if args.fleet_pool:
+        try:
+            pool = shared_pool(args.fleet_pool)
+        except (OSError, FleetPoolError) as e:
+            parser.error(f"{args.fleet_pool}: {e}")
+        if pool.size != args.size or sorted(pool.fleet) != sorted(fleet):
+            parser.error(f"{args.fleet_pool}: pool is for size {pool.size}, fleet {pool.fleet}")
+
+    stats, elapsed = run(
+        args.games,
+        args.batch,
+        args.workers,
+        args.seed,
+        args.strategy,
+        args.size,
+        args.fleet,
+        report=print_report,
+        fleet_pool=args.fleet_pool,
+    )
+    write_result(stats, elapsed, args.json_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+﻿import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from functools import partial
+
+from .ai import AIPlayer
+from .board import Board, UnshotComplement
+from .config import GRID_SIZE, MAX_GRID_SIZE
+
+SEED = 12345
+
+
+def measure(fn, number, repeat, warmup, setup=None):
+    # Per-call times in microseconds, one sample per repeat; every repeat
+    # reseeds the RNG so each run sees the same boards and shots.
+    for _ in range(warmup):
+        random.seed(SEED)
+        state = setup() if setup else None
+        for _ in range(number):
+            fn(state)
+
+    samples = []
+    for _ in range(repeat):
+        random.seed(SEED)
+        state = setup() if setup else None
+        started = time.perf_counter()
+        for _ in range(number):
+            fn(state)
+        samples.append((time.perf_counter() - started) / number * 1e6)
+    return {
+        "median_us": statistics.median(samples),
+        "min_us": min(samples),
+        "mean_us": statistics.fmean(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _placed_board(size=GRID_SIZE):
+    board = Board(size)
+    board.place_ships_auto()
+    return board
+
+
+def _shot_order(size=GRID_SIZE):
+    cells = [(x, y) for y in range(size) for x in range(size)]
+    random.shuffle(cells)
+    return cells
+
+
+def _play_out(board, order):
+    for x, y in order:
+        board.shoot(x, y)
+
+
+def _ai_game(strategy):
+    board = _placed_board()
+    ai = AIPlayer(strategy)
+    while not board.all_sunk():
+        shot = ai.choose_shot(board)
+        result = board.shoot(*shot)
+        ai.process_result(shot, result, board)
+
+
+def rules_benchmarks():
+    def shoot_setup():
+        return [(_placed_board(), _shot_order()) for _ in range(200)]
+
+    def shoot_game(state):
+        board, order = state.pop()
+        _play_out(board, order)
+
+    def can_place_setup():
+        board = _placed_board()
+        return board, [[(x + i, y) for i in range(3)] for y in range(GRID_SIZE) for x in range(GRID_SIZE - 2)]
+
+    def can_place(state):
+        board, candidates = state
+        for cells in candidates:
+            board.can_place(cells)
+
+    def all_sunk_setup():
+        board = _placed_board()
+        _play_out(board, _shot_order()[: GRID_SIZE * GRID_SIZE // 2])
+        return board
+
+    def unshot_late_setup():
+        # Half of a 1000x1000 board shot: a move must cost no more than on a
+        # fresh board (discard and choice are O(log n), not O(shots)).
+        cells = UnshotComplement(MAX_GRID_SIZE)
+        for idx in range(0, MAX_GRID_SIZE * MAX_GRID_SIZE, 2):
+            cells.discard(idx)
+        return cells, list(range(1, MAX_GRID_SIZE * MAX_GRID_SIZE, 2))
+
+    def unshot_late(state):
+        cells, order = state
+        cells.discard(order.pop())
+        cells.choice()
+
+    return {
+        "board.place_ships_auto": (lambda _: Board().place_ships_auto(), None, 200),
+        "board.shoot[full board]": (shoot_game, shoot_setup, 200),
+        "board.can_place[x80]": (can_place, can_place_setup, 200),
+        "board.all_sunk": (lambda board: board.all_sunk(), all_sunk_setup, 20000),
+        "unshot.discard+choice[1000x1000, half shot]": (unshot_late, unshot_late_setup, 20000),
+    }
+
+
+def ai_benchmarks():
+    out = {}
+    for strategy in ["hunt", "parity", "density"]:
+        out[f"ai.game[{strategy}]"] = (lambda _, s=strategy: _ai_game(s), None, 20 if strategy == "density" else 200)
+    return out
+
+
+UI_STATES = ["menu", "coin", "play", "scores", "gameover"]
+UI_NAMES = (
+    ["sounds.init[no cache]", "sounds.init[cached]"]
+    + [f"draw[{state}]" for state in UI_STATES]
+    + ["draw[play, incremental]"]
+)
+
+
+def ui_benchmarks(stack):
+    # Imported lazily so rules/AI benchmarks never load pygame. The Game and
+    # its temporary data directory are released through `stack`.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+
+    from .core import Game, SimpleSounds
+
+    # Records, replays and the sound cache go to a throwaway directory.
+    workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix="sea_battle_bench_"))
+    game = Game(data_dir=workdir)
+    stack.callback(game.score_manager.close)
+    stack.callback(game.fleet_pool.close)
+    stack.callback(game.thinker.shutdown)
+    cache_dir = os.path.join(workdir, "sounds")
+
+    def sounds_cold(_):
+        SimpleSounds(cache_dir=None)
+
+    def sounds_warm(_):
+        SimpleSounds(cache_dir=cache_dir)
+
+    def frame(state, full=True):
+        def setup():
+            game.reset_game()
+            game.state = state
+            game.start_time = game.scheduler.now
+            if state == "gameover":
+                game.player_won = True
+                game.end_time = game.start_time
+            game.drawn_state = None
+            if not full:
+                game.draw((0, 0))
+            return None
+
+        def run(_):
+            if full:
+                game.drawn_state = None
+            game.draw((0, 0))
+            pygame.display.flip()
+
+        return run, setup, 100
+
+    out = {
+        "sounds.init[no cache]": (sounds_cold, None, 5),
+        "sounds.init[cached]": (sounds_warm, None, 20),
+    }
+    for state in UI_STATES:
+        out[f"draw[{state}]"] = frame(state)
+    out["draw[play, incremental]"] = frame("play", full=False)
+    return out
+
+
+def run_all(only=None, quick=False, groups=("rules", "ai", "ui")):
+    results = {}
+    with contextlib.ExitStack() as stack:
+        suites = {"rules": rules_benchmarks, "ai": ai_benchmarks, "ui": partial(ui_benchmarks, stack)}
+        for group in groups:
+            if group == "ui" and only and not any(only in name for name in UI_NAMES):
+                # Building the ui suite opens a Game; skip it when nothing matches.
+                continue
+            for name, (fn, setup, number) in suites[group]().items():
+                if only and only not in name:
+                    continue
+                repeat = 3 if quick else 7
+                number = max(1, number // 5) if quick else number
+                results[name] = measure(fn, number, repeat, warmup=1, setup=setup)
+                print(f"{name:32s} {results[name]['median_us']:12.1f} us", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": SEED,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:32s} {'new':>12s}")
+            continue
+        ratio = cur["median_us"] / base["median_us"] if base["median_us"] else float("inf")
+        flag = ""
+        if ratio > 1.0 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1.0 - threshold:
+            flag = "  faster"
+        print(f"{name:32s} {base['median_us']:12.1f} -> {cur['median_us']:12.1f} us  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for rules, AI and rendering hot paths")
+    parser.add_argument("--only", default=None, help="run benchmarks whose name contains this text")
+    parser.add_argument("--group", action="append", choices=["rules", "ai", "ui"], default=None)
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging")
+    args = parser.parse_args(argv)
+
+    current = run_all(args.only, args.quick, tuple(args.group or ("rules", "ai", "ui")))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+    elif not args.output:
+        print(json.dumps(current, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,270 @@
 ﻿import random
+from array import array
+from functools import lru_cache
 
-from .ui import GRID_SIZE
+from .config import GRID_SIZE, SHIP_SIZES, BITBOARD_LIMIT
+
+
+# Cells are packed into Python ints: bit index = y * grid_size + x.
+@lru_cache(maxsize=None)
+def halo_masks(grid_size=GRID_SIZE):
+    halos = []
+    for y in range(grid_size):
+        for x in range(grid_size):
+            mask = 0
+            for ny in range(max(0, y - 1), min(grid_size, y + 2)):
+                for nx in range(max(0, x - 1), min(grid_size, x + 2)):
+                    mask |= 1 << (ny * grid_size + nx)
+            halos.append(mask)
+    return tuple(halos)
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def cells_mask(cells, grid_size=GRID_SIZE):
+    mask = 0
+    for x, y in cells:
+        mask |= 1 << (y * grid_size + x)
+    return mask
+
+
+def halo_mask(mask, grid_size=GRID_SIZE):
+    halos = halo_masks(grid_size)
+    out = 0
+    for idx in iter_bits(mask):
+        out |= halos[idx]
+    return out
+
+
+@lru_cache(maxsize=None)
+def placement(x, y, size, horizontal, grid_size=GRID_SIZE):
+    if horizontal:
+        cells = [(x + i, y) for i in range(size)]
+    else:
+        cells = [(x, y + i) for i in range(size)]
+    mask = cells_mask(cells, grid_size)
+    return cells, mask, halo_mask(mask, grid_size)
+
+
+@lru_cache(maxsize=None)
+def placement_table(size, grid_size=GRID_SIZE):
+    n = grid_size
+    table = [placement(x, y, size, True, n) for y in range(n) for x in range(n - size + 1)]
+    if size > 1:
+        table += [placement(x, y, size, False, n) for y in range(n - size + 1) for x in range(n)]
+    return tuple(table)
+
+
+def random_fleet(sizes=SHIP_SIZES, rng=random, grid_size=GRID_SIZE, max_restarts=1000):
+    # Each ship is drawn uniformly from the placements still legal after the
+    # previous ones; a dead end restarts the fleet, so the cost is bounded.
+    if grid_size > BITBOARD_LIMIT:
+        return _random_sparse_fleet(sizes, rng, grid_size, max_restarts)
+    for _ in range(max_restarts):
+        options = {size: placement_table(size, grid_size) for size in set(sizes)}
+        pending = {size: sizes.count(size) for size in options}
+        fleet = []
+        for size in sizes:
+            if not options[size]:
+                break
+            chosen = rng.choice(options[size])
+            fleet.append(chosen)
+            pending[size] -= 1
+            halo = chosen[2]
+            for other in options:
+                if pending[other]:
+                    options[other] = [p for p in options[other] if not p[1] & halo]
+        else:
+            return fleet
+    raise RuntimeError(f"Could not place fleet {sizes} on a {grid_size}x{grid_size} board")
+
+
+def _random_sparse_fleet(sizes, rng, grid_size, max_restarts, max_attempts=10000):
+    # Big boards are mostly empty: rejection sampling over all placements is
+    # uniform over the legal ones and needs no table of every position. The
+    # blocked cells live in one transient bytearray (1 MB at 1000x1000), so
+    # each check and each halo is a slice rather than a cell-by-cell loop.
+    n = grid_size
+    for _ in range(max_restarts):
+        blocked = bytearray(n * n)
+        fleet = []
+        for size in sizes:
+            across = n * (n - size + 1)
+            total = across + (across if size > 1 else 0)
+            for _ in range(max_attempts):
+                k = rng.randrange(total)
+                if k < across:
+                    y, x = divmod(k, n - size + 1)
+                    start = y * n + x
+                    if not any(blocked[start : start + size]):
+                        cells = [(x + i, y) for i in range(size)]
+                        x0, y0, x1, y1 = x, y, x + size - 1, y
+                        break
+                else:
+                    y, x = divmod(k - across, n)
+                    start = y * n + x
+                    if not any(blocked[start : start + size * n : n]):
+                        cells = [(x, y + i) for i in range(size)]
+                        x0, y0, x1, y1 = x, y, x, y + size - 1
+                        break
+            else:
+                break
+            fleet.append((cells, None, None))
+            x0, x1 = max(0, x0 - 1), min(n, x1 + 2)
+            halo = b"\x01" * (x1 - x0)
+            for ny in range(max(0, y0 - 1), min(n, y1 + 2)):
+                blocked[ny * n + x0 : ny * n + x1] = halo
+        else:
+            return fleet
+    raise RuntimeError(f"Could not place fleet of {len(sizes)} ships on a {n}x{n} board")
+
+
+def random_fleets(count, sizes=SHIP_SIZES, rng=random, grid_size=GRID_SIZE):
+    return [random_fleet(sizes, rng, grid_size) for _ in range(count)]
+
+
+def check_fleet(sizes, grid_size):
+    # ValueError unless random_fleet() can place `sizes` on the board. A ship
+    # with the right and bottom half of its halo covers 2 * (size + 1) cells
+    # of a board one cell larger, and those blocks never overlap; past the
+    # quick checks one trial placement settles it (~0.1 s at 1000x1000).
+    longest = max(sizes)
+    if longest > grid_size:
+        raise ValueError(f"a {longest}-cell ship does not fit on a {grid_size}x{grid_size} board")
+    area = sum(2 * (size + 1) for size in sizes)
+    if area > (grid_size + 1) ** 2:
+        raise ValueError(f"{len(sizes)} ships do not fit on a {grid_size}x{grid_size} board")
+    try:
+        random_fleet(sizes, random.Random(0), grid_size)
+    except RuntimeError as exc:
+        raise ValueError(str(exc)) from None
+
+
+class CellIndex:
+    # Set of cell indices with O(1) removal and uniform random choice.
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.pos = {item: i for i, item in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.pos
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def discard(self, item):
+        i = self.pos.pop(item, None)
+        if i is None:
+            return
+        last = self.items.pop()
+        if last != item:
+            self.items[i] = last
+            self.pos[last] = i
+
+    def choice(self, rng=random):
+        if not self.items:
+            return None
+        return self.items[rng.randrange(len(self.items))]
+
+
+class UnshotComplement:
+    # Unshot cells of a large board, optionally of one checkerboard colour,
+    # kept as the complement of the shot ones, so the index never scans the
+    # grid. Shot ranks are counted in a Fenwick tree, allocated at the first
+    # shot: discard() and choice() stay O(log n) however many cells are shot.
+    # Same discard/choice interface as CellIndex.
+    def __init__(self, n, parity=None):
+        self.n = n
+        self.parity = parity
+        if parity is None:
+            self.per_pair = 2 * n
+            self.first = n
+        else:
+            # Cells of one colour in an even and an odd row.
+            self.first = (n - parity + 1) // 2
+            self.per_pair = self.first + (n - (1 - parity) + 1) // 2
+        self.total = (n // 2) * self.per_pair + (n % 2) * self.first
+        # Power of two covering every rank, for the top-down search in choice().
+        self.top = 1 << max(0, self.total - 1).bit_length()
+        self.count = 0
+        self.shot = None
+        self.tree = None
+
+    def __len__(self):
+        return self.total - self.count
+
+    def _rank(self, idx):
+        if self.parity is None:
+            return idx
+        y, x = divmod(idx, self.n)
+        return (y // 2) * self.per_pair + (y % 2) * self.first + x // 2
+
+    def _unrank(self, rank):
+        if self.parity is None:
+            return rank
+        pair, rem = divmod(rank, self.per_pair)
+        y = 2 * pair
+        if rem >= self.first:
+            y += 1
+            rem -= self.first
+        return y * self.n + (self.parity - y) % 2 + 2 * rem
+
+    def __contains__(self, idx):
+        return self.shot is None or not self.shot[self._rank(idx)]
+
+    def discard(self, idx):
+        rank = self._rank(idx)
+        if self.shot is None:
+            self.shot = bytearray(self.total)
+            self.tree = array("I", [0]) * (self.top + 1)
+        if self.shot[rank]:
+            return
+        self.shot[rank] = 1
+        self.count += 1
+        tree = self.tree
+        i = rank + 1
+        while i <= self.top:
+            tree[i] += 1
+            i += i & -i
+
+    def choice(self, rng=random):
+        if not len(self):
+            return None
+        r = rng.randrange(len(self))
+        tree = self.tree
+        if tree is None:
+            return self._unrank(r)
+        # Walk down to the r-th free rank: node pos + step covers `step`
+        # ranks, tree[pos + step] of them shot.
+        pos = 0
+        step = self.top
+        while step:
+            free = step - tree[pos + step]
+            if free <= r:
+                pos += step
+                r -= free
+            step >>= 1
+        return self._unrank(pos)
 
 
 class Ship:
-    def __init__(self, cells):
+    def __init__(self, cells, mask=None, halo=None, grid_size=GRID_SIZE):
         self.cells = cells
         self.hits = set()
+        if mask is None and grid_size <= BITBOARD_LIMIT:
+            mask = cells_mask(cells, grid_size)
+        if halo is None and mask is not None:
+            halo = halo_mask(mask, grid_size)
+        self.mask = mask
+        self.halo = halo
 
     def hit(self, cell):
         self.hits.add(cell)
@@ -15,53 +273,158 @@ class Ship:
         return len(self.hits) == len(self.cells)
 
 
+class SparseRow:
+    # One row of a large board: only cells that differ from `default` are stored.
+    __slots__ = ("cells", "default", "n")
+
+    def __init__(self, n, default):
+        self.cells = {}
+        self.default = default
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, x):
+        return self.cells.get(x, self.default)
+
+    def __setitem__(self, x, value):
+        if value == self.default:
+            self.cells.pop(x, None)
+        else:
+            self.cells[x] = value
+
+    def __iter__(self):
+        get = self.cells.get
+        default = self.default
+        return (get(x, default) for x in range(self.n))
+
+    def __bytes__(self):
+        row = bytearray([self.default]) * self.n
+        for x, value in self.cells.items():
+            row[x] = value
+        return bytes(row)
+
+
+class SparseRows:
+    # grid/shots for boards above BITBOARD_LIMIT. Indexed like the list of
+    # rows used on small boards, but memory grows with ships and shots, not
+    # with the number of cells; row objects are created on first access.
+    def __init__(self, n, default):
+        self.rows = {}
+        self.default = default
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, y):
+        row = self.rows.get(y)
+        if row is None:
+            if not 0 <= y < self.n:
+                raise IndexError(y)
+            row = self.rows[y] = SparseRow(self.n, self.default)
+        return row
+
+    def __iter__(self):
+        return (self[y] for y in range(self.n))
+
+
 class Board:
-    def __init__(self):
-        self.grid = [[-1 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-        self.shots = [[0 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-        self.ships = []
+    def __init__(self, size=GRID_SIZE, fleet=SHIP_SIZES):
+        self.size = size
+        self.fleet = list(fleet)
+        self.bitboard = size <= BITBOARD_LIMIT
+        self.reset()
 
     def in_bounds(self, x, y):
-        return 0 <= x < GRID_SIZE and 0 <= y < GRID_SIZE
+        return 0 <= x < self.size and 0 <= y < self.size
 
-    def place_ships_auto(self):
-        self.grid = [[-1 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-        self.shots = [[0 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
+    def reset(self):
+        n = self.size
+        if self.bitboard:
+            self.grid = [array("i", [-1]) * n for _ in range(n)]
+            self.shots = [bytearray(n) for _ in range(n)]
+        else:
+            self.grid = SparseRows(n, -1)
+            self.shots = SparseRows(n, 0)
         self.ships = []
+        self.sunk_count = 0
+        # Cell indices in the order their shot state changed (UI, replays).
+        self.shot_log = []
 
-        ship_sizes = [4, 3, 3, 2, 2, 2, 1, 1, 1, 1]
-        for size in ship_sizes:
-            placed = False
-            attempts = 0
-            while not placed and attempts < 2000:
-                attempts += 1
-                horizontal = random.choice([True, False])
-                if horizontal:
-                    x = random.randint(0, GRID_SIZE - size)
-                    y = random.randint(0, GRID_SIZE - 1)
-                    cells = [(x + i, y) for i in range(size)]
-                else:
-                    x = random.randint(0, GRID_SIZE - 1)
-                    y = random.randint(0, GRID_SIZE - size)
-                    cells = [(x, y + i) for i in range(size)]
-
-                if self.can_place(cells):
-                    ship = Ship(cells)
-                    ship_index = len(self.ships)
-                    for cx, cy in cells:
-                        self.grid[cy][cx] = ship_index
-                    self.ships.append(ship)
-                    placed = True
-            if not placed:
-                self.place_ships_auto()
-                return
+        # Bitboard state mirrored by grid/shots on boards up to BITBOARD_LIMIT.
+        self.ship_mask = 0
+        self.shot_mask = 0
+        self.hit_mask = 0
+        self.blocked_mask = 0
+
+        # Unshot cells, overall and by checkerboard colour (x + y) % 2. Small
+        # boards build the index on first use: random picks sample the grid
+        # directly until it fills up. Large boards track the complement of the
+        # shots from the start, so nothing ever scans all the cells.
+        self.unshot = None
+        self.unshot_parity = None
+        if not self.bitboard:
+            self.unshot = UnshotComplement(n)
+            self.unshot_parity = (UnshotComplement(n, 0), UnshotComplement(n, 1))
+
+    def unshot_cells(self, parity=None):
+        if self.unshot is None:
+            n = self.size
+            free = [y * n + x for y in range(n) for x in range(n) if self.shots[y][x] == 0]
+            self.unshot = CellIndex(free)
+            self.unshot_parity = (
+                CellIndex(i for i in free if (i // n + i % n) % 2 == 0),
+                CellIndex(i for i in free if (i // n + i % n) % 2 == 1),
+            )
+        return self.unshot if parity is None else self.unshot_parity[parity]
+
+    def random_unshot(self, parity=None, rng=random):
+        n = self.size
+        if self.unshot is None:
+            for _ in range(16):
+                x = rng.randrange(n)
+                y = rng.randrange(n)
+                if self.shots[y][x] == 0 and (parity is None or (x + y) % 2 == parity):
+                    return x, y
+        idx = self.unshot_cells(parity).choice(rng)
+        if idx is None:
+            return None
+        return idx % n, idx // n
+
+    def _mark_shot(self, idx, value):
+        n = self.size
+        self.shots[idx // n][idx % n] = value
+        self.shot_log.append(idx)
+        if self.unshot is not None:
+            self.unshot.discard(idx)
+            self.unshot_parity[(idx // n + idx % n) % 2].discard(idx)
+
+    def place_ships_auto(self):
+        self.place_fleet(random_fleet(self.fleet, grid_size=self.size))
+
+    def place_fleet(self, fleet):
+        self.reset()
+        for cells, mask, halo in fleet:
+            self.add_ship(Ship(list(cells), mask, halo, self.size))
+
+    def add_ship(self, ship):
+        ship_index = len(self.ships)
+        for cx, cy in ship.cells:
+            self.grid[cy][cx] = ship_index
+        self.ships.append(ship)
+        if self.bitboard:
+            self.ship_mask |= ship.mask
+            self.blocked_mask |= ship.halo
 
     def can_place(self, cells):
         for x, y in cells:
             if not self.in_bounds(x, y):
                 return False
-            if self.grid[y][x] != -1:
-                return False
+        if self.bitboard:
+            return not cells_mask(cells, self.size) & self.blocked_mask
+        for x, y in cells:
             for nx in range(x - 1, x + 2):
                 for ny in range(y - 1, y + 2):
                     if self.in_bounds(nx, ny) and self.grid[ny][nx] != -1:
@@ -74,25 +437,61 @@ class Board:
         if self.shots[y][x] != 0:
             return "repeat"
 
+        idx = y * self.size + x
         ship_index = self.grid[y][x]
+        if self.bitboard:
+            self.shot_mask |= 1 << idx
         if ship_index == -1:
-            self.shots[y][x] = 1
+            self._mark_shot(idx, 1)
             return "miss"
 
-        self.shots[y][x] = 2
+        self._mark_shot(idx, 2)
+        if self.bitboard:
+            self.hit_mask |= 1 << idx
         ship = self.ships[ship_index]
         ship.hit((x, y))
         if ship.is_sunk():
+            self.sunk_count += 1
             self._mark_around_sunk(ship)
             return "sunk"
         return "hit"
 
+    def apply_result(self, x, y, result, cells=None):
+        # Mirrors a shot resolved elsewhere, e.g. by a match server, on a board
+        # whose ships are unknown until sunk; `cells` is the sunk ship.
+        if result == "repeat" or self.shots[y][x] != 0:
+            return
+        idx = y * self.size + x
+        if self.bitboard:
+            self.shot_mask |= 1 << idx
+        if result == "miss":
+            self._mark_shot(idx, 1)
+            return
+
+        self._mark_shot(idx, 2)
+        if self.bitboard:
+            self.hit_mask |= 1 << idx
+        if result == "sunk":
+            ship = Ship(list(cells), grid_size=self.size)
+            ship.hits = set(ship.cells)
+            self.add_ship(ship)
+            self.sunk_count += 1
+            self._mark_around_sunk(ship)
+
     def _mark_around_sunk(self, ship):
+        if self.bitboard:
+            fresh = ship.halo & ~self.shot_mask
+            self.shot_mask |= fresh
+            for idx in iter_bits(fresh):
+                self._mark_shot(idx, 1)
+            return
+
+        n = self.size
         for x, y in ship.cells:
-            for nx in range(x - 1, x + 2):
-                for ny in range(y - 1, y + 2):
-                    if self.in_bounds(nx, ny) and self.shots[ny][nx] == 0:
-                        self.shots[ny][nx] = 1
+            for nx in range(max(0, x - 1), min(n, x + 2)):
+                for ny in range(max(0, y - 1), min(n, y + 2)):
+                    if self.shots[ny][nx] == 0:
+                        self._mark_shot(ny * n + nx, 1)
 
     def all_sunk(self):
-        return all(ship.is_sunk() for ship in self.ships)
+        return self.sunk_count == len(self.ships)
@@ -0,0 +1,29 @@
+﻿# Rules configuration shared by the headless engine and the pygame UI.
+import os
+
+GRID_SIZE = 10
+SHIP_SIZES = [4, 3, 3, 2, 2, 2, 1, 1, 1, 1]
+MAX_GRID_SIZE = 1000
+
+# Boards up to this side keep bitmask state and a full placement table;
+# larger boards fall back to sparse per-row state and rejection sampling.
+BITBOARD_LIMIT = 32
+
+# Everything the game writes (records, replays, sound and data caches) is
+# kept next to the package, so it does not depend on the working directory.
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generated data: heatmap priors, fleet pools.
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+
+def default_fleet(grid_size):
+    # One classic fleet per 20x20 block keeps big boards sparse enough to place.
+    copies = max(1, (grid_size * grid_size) // 400)
+    return SHIP_SIZES * copies
+
+
+def parse_fleet(text):
+    sizes = [int(part) for part in text.replace(" ", "").split(",") if part]
+    if not sizes or min(sizes) < 1:
+        raise ValueError(f"Invalid fleet: {text!r}")
+    return sorted(sizes, reverse=True)
@@ -1,32 +1,49 @@
-﻿import io
+﻿import array
+import hashlib
+import io
+import logging
 import math
 import os
 import random
-import struct
 import sys
 import time
 import wave
+from collections import deque
 
 import pygame
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
 try:
     from .ai import Player, AIPlayer
+    from .config import default_fleet, parse_fleet
+    from .fleetpool import FleetPool, FleetPoolError
+    from .net import NetClient, parse_records
+    from .perf import FrameProfiler
+    from .think import Thinker
+    from .timers import Scheduler
+    from .replay import HUMAN, AI, GameLog, GameRecorder, ReplayCursor, fleet_placements
+    from .render import BoardRenderer
     from .scores import ScoreManager
     from .ui import (
         SCREEN_WIDTH,
         SCREEN_HEIGHT,
         FPS,
+        IDLE_MAX_WAIT,
         MARGIN,
         GAP,
         TOP,
         BOARD_SIZE,
-        GRID_SIZE,
         CELL_SIZE,
+        GRID_SIZE,
         WHITE,
         BLACK,
-        LIGHT_GRAY,
         DARK,
-        GRAY,
         BLUE,
         RED,
         GREEN,
@@ -35,7 +52,10 @@ try:
         BG_RIGHT,
         BG_DIVIDER,
         RECORDS_FILE,
+        REPLAY_DIR,
+        SOUND_CACHE_DIR,
         Button,
+        render_text,
     )
 except ImportError:
     # Allow running this file directly: python game/core.py
@@ -44,22 +64,29 @@ except ImportError:
         sys.path.insert(0, this_dir)
 
     from ai import Player, AIPlayer
+    from config import default_fleet, parse_fleet
+    from fleetpool import FleetPool
+    from net import NetClient, parse_records
+    from perf import FrameProfiler
+    from think import Thinker
+    from timers import Scheduler
+    from replay import HUMAN, AI, GameLog, GameRecorder, ReplayCursor, fleet_placements
+    from render import BoardRenderer
     from scores import ScoreManager
     from ui import (
         SCREEN_WIDTH,
         SCREEN_HEIGHT,
         FPS,
+        IDLE_MAX_WAIT,
         MARGIN,
         GAP,
         TOP,
         BOARD_SIZE,
-        GRID_SIZE,
         CELL_SIZE,
+        GRID_SIZE,
         WHITE,
         BLACK,
-        LIGHT_GRAY,
         DARK,
-        GRAY,
         BLUE,
         RED,
         GREEN,
@@ -68,14 +95,64 @@ except ImportError:
         BG_RIGHT,
         BG_DIVIDER,
         RECORDS_FILE,
+        REPLAY_DIR,
+        SOUND_CACHE_DIR,
         Button,
+        render_text,
     )
 
+NET_EVENT = pygame.USEREVENT + 1
+AI_EVENT = pygame.USEREVENT + 2
+REPLAY_SPEEDS = [0.5, 1.0, 2.0, 4.0, 8.0, 32.0, 128.0, float("inf")]
+# Part of the sound cache key: bump when synth_wav output changes so stale
+# cached WAVs are regenerated.
+SYNTH_VERSION = 1
+
+
+def synth_wav(f0, f1, duration, volume, sample_rate=44100):
+    samples = max(1, int(sample_rate * duration))
+    attack = max(1, int(samples * 0.08))
+    release = max(1, int(samples * 0.12))
+
+    if np is not None:
+        i = np.arange(samples, dtype=np.float64)
+        cur = f0 + (f1 - f0) * (i / samples)
+        amp = np.sin(2.0 * math.pi * cur * (i / sample_rate))
+        env = np.ones(samples)
+        env[:attack] = i[:attack] / attack
+        tail = i > samples - release
+        env[tail] = np.maximum(0.0, (samples - i[tail]) / release)
+        frames = (32767 * volume * env * amp).astype("<i2").tobytes()
+    else:
+        pcm = array.array("h", bytes(2 * samples))
+        for i in range(samples):
+            cur = f0 + (f1 - f0) * (i / samples)
+            env = 1.0
+            if i < attack:
+                env = i / attack
+            elif i > samples - release:
+                env = max(0.0, (samples - i) / release)
+            pcm[i] = int(32767 * volume * env * math.sin(2.0 * math.pi * cur * (i / sample_rate)))
+        if sys.byteorder == "big":
+            pcm.byteswap()
+        frames = pcm.tobytes()
+
+    with io.BytesIO() as buff:
+        with wave.open(buff, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(frames)
+        return buff.getvalue()
+
 
 class SimpleSounds:
-    def __init__(self):
+    def __init__(self, cache_dir=SOUND_CACHE_DIR):
+        started = time.perf_counter()
         self.enabled = False
         self.sfx = {}
+        self.cache_dir = cache_dir
+        self.cache_hits = 0
         try:
             if pygame.mixer.get_init() is None:
                 pygame.mixer.init(44100, -16, 1, 512)
@@ -93,6 +170,7 @@ class SimpleSounds:
         except pygame.error:
             self.enabled = False
             self.sfx = {}
+        self.startup_time = time.perf_counter() - started
 
     def play(self, name):
         if not self.enabled:
@@ -101,47 +179,61 @@ class SimpleSounds:
         if snd is not None:
             snd.play()
 
+    def stats(self):
+        return {"sounds": len(self.sfx), "cache_hits": self.cache_hits, "startup_ms": self.startup_time * 1000.0}
+
     def _tone(self, freq, duration, volume):
-        return self._build_sound(duration, volume, lambda t, _: math.sin(2.0 * math.pi * freq * t))
+        return self._build_sound(freq, freq, duration, volume)
 
     def _sweep(self, f0, f1, duration, volume):
-        def wave_fn(t, ratio):
-            cur = f0 + (f1 - f0) * ratio
-            return math.sin(2.0 * math.pi * cur * t)
-
-        return self._build_sound(duration, volume, wave_fn)
-
-    def _build_sound(self, duration, volume, wave_fn):
-        sample_rate = 44100
-        samples = max(1, int(sample_rate * duration))
-        attack = max(1, int(samples * 0.08))
-        release = max(1, int(samples * 0.12))
-
-        frames = bytearray()
-        for i in range(samples):
-            t = i / sample_rate
-            ratio = i / samples
-            amp = wave_fn(t, ratio)
-            env = 1.0
-            if i < attack:
-                env = i / attack
-            elif i > samples - release:
-                env = max(0.0, (samples - i) / release)
-            val = int(32767 * volume * env * amp)
-            frames.extend(struct.pack("<h", val))
-
-        with io.BytesIO() as buff:
-            with wave.open(buff, "wb") as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)
-                wf.setframerate(sample_rate)
-                wf.writeframes(frames)
-            buff.seek(0)
-            return pygame.mixer.Sound(file=buff)
+        return self._build_sound(f0, f1, duration, volume)
+
+    def _build_sound(self, f0, f1, duration, volume):
+        key = f"v{SYNTH_VERSION}-{f0}-{f1}-{duration}-{volume}-44100"
+        path = None
+        data = None
+        if self.cache_dir:
+            digest = hashlib.sha1(key.encode("ascii")).hexdigest()[:16]
+            path = os.path.join(self.cache_dir, f"{digest}.wav")
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.cache_hits += 1
+            except OSError:
+                data = None
+
+        if data is None:
+            data = synth_wav(f0, f1, duration, volume)
+            if path is not None:
+                self._write_cache(path, data)
+        return pygame.mixer.Sound(file=io.BytesIO(data))
+
+    def _write_cache(self, path, data):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, grid_size=GRID_SIZE, fleet=None, perf_overlay=False, perf_trace=None, record=True, clock=None, data_dir=None):
+        self.grid_size = grid_size
+        # Records, replays and the sound cache live next to the package;
+        # data_dir moves all three elsewhere (benchmarks, throwaway runs).
+        records_file, sound_cache_dir, self.replay_dir = RECORDS_FILE, SOUND_CACHE_DIR, REPLAY_DIR
+        if data_dir is not None:
+            records_file, sound_cache_dir, self.replay_dir = (
+                os.path.join(data_dir, os.path.basename(path)) for path in (RECORDS_FILE, SOUND_CACHE_DIR, REPLAY_DIR)
+            )
+        # All game timing reads scheduler.now, sampled once per frame; pass a
+        # timers.VirtualClock to drive the game headless with fast_forward().
+        self.scheduler = Scheduler(clock or time.monotonic)
+        self.fleet = list(fleet) if fleet else default_fleet(grid_size)
+
         pygame.mixer.pre_init(44100, -16, 1, 512)
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
@@ -153,16 +245,17 @@ class Game:
         self.title_font = pygame.font.SysFont("arial", 40, bold=True)
         self.timer_font = pygame.font.SysFont("arial", 28, bold=True)
 
-        self.score_manager = ScoreManager(RECORDS_FILE)
-        self.sounds = SimpleSounds()
+        self.score_manager = ScoreManager(records_file)
+        self.sounds = SimpleSounds(sound_cache_dir)
 
         self.state = "menu"
-        self.player = Player()
-        self.ai = AIPlayer()
+        self.player = Player(self.grid_size, self.fleet)
+        self.ai = AIPlayer(size=self.grid_size, fleet=self.fleet)
 
         self.current_turn = "player"
         self.coin_result = None
-        self.coin_time = None
+        self.coin_timer = None
+        self.coin_delay = 1.2
 
         self.start_time = None
         self.end_time = None
@@ -174,21 +267,98 @@ class Game:
 
         self.shot_anim = None
         self.anim_duration = 0.35
+        # The AI thinks on a worker thread (inline on a virtual clock): a move
+        # shows after at least ai_think_delay and at most about ai_time_budget
+        # seconds.
         self.ai_think_delay = 1.0
+        self.ai_time_budget = 2.0
+        self.thinker = Thinker(
+            notify=lambda: pygame.event.post(pygame.event.Event(AI_EVENT)),
+            clock=self.scheduler.clock,
+            inline=self.scheduler.clock is not time.monotonic,
+        )
+        self.ai_task = None
+        # Fleets are generated ahead on a background thread, so starting a
+        # game only pops two ready placements.
+        self.fleet_pool = FleetPool(self.grid_size, self.fleet).start()
+        # Why the last new game could not start, shown in the menu.
+        self.fleet_error = None
 
         self.scores_scroll = 0
         self.max_name_len = 20
         self.name_limit_warning_until = 0.0
 
-    def reset_game(self):
-        self.player = Player()
-        self.ai = AIPlayer()
-        self.player.board.place_ships_auto()
-        self.ai.board.place_ships_auto()
+        self.idle_pacing = True
+
+        self.backgrounds = {}
+        self.board_renderers = {True: BoardRenderer(True), False: BoardRenderer(False)}
+        self.drawn_state = None
+        self.drawn_timer = None
+        self.timer_rect = None
+        self.drawn_fleet = {}
+        self.pan_origin = None
+
+        # F3 toggles the frame-time overlay; the profiler itself always runs.
+        self.profiler = FrameProfiler(trace_path=perf_trace)
+        self.perf_overlay = perf_overlay
+        self.perf_panel = None
+        self.perf_panel_at = 0.0
+
+        # Every game is streamed to replay_dir; a loaded log replaces input in play.
+        self.record = record
+        self.recorder = None
+        self.seed = None
+        self.replay = None
+        self.replay_speed = 1.0
+        self.replay_paused = False
+        self.replay_tick = 0.0
+
+        # Network client mode: the server owns both fleets, self.ai.board only
+        # mirrors what our shots revealed, and opponent shots are replayed from
+        # net_inbox at the AI pace.
+        self.net = None
+        self.net_match = None
+        self.net_inbox = deque()
+        # Last ERR line from the server, shown next to the network status.
+        self.net_error = None
+
+    def reset_game(self, log=None):
+        self.stop_recording()
+        self.cancel_ai()
+        self.replay = None
+        # The seed reproduces the whole game: its halves are the pool seeds of
+        # the two fleets (fleetpool.seeded_fleet), and the shared RNG seeded
+        # with it drives the coin and AI shots.
+        if log:
+            self.seed = log.seed
+        else:
+            pool = self.fleet_source()
+            try:
+                player_seed, player_fleet = pool.take_seeded()
+                ai_seed, ai_fleet = pool.take_seeded()
+            except FleetPoolError as e:
+                logger.error("cannot start a game: %s", e)
+                self.fleet_error = str(e)
+                self.state = "menu"
+                return False
+            self.fleet_error = None
+            self.seed = player_seed << 32 | ai_seed
+        random.seed(self.seed)
+        self.player = Player(self.grid_size, self.fleet)
+        self.ai = AIPlayer(size=self.grid_size, fleet=self.fleet)
+        if log:
+            self.player.board, self.ai.board = log.boards()
+            self.replay = ReplayCursor(log, [self.player.board, self.ai.board])
+        else:
+            self.player.board.place_fleet(player_fleet)
+            self.ai.board.place_fleet(ai_fleet)
+            self.start_recording()
 
         self.current_turn = "player"
         self.coin_result = None
-        self.coin_time = None
+        if self.coin_timer is not None:
+            self.coin_timer.cancel()
+            self.coin_timer = None
 
         self.start_time = None
         self.end_time = None
@@ -201,21 +371,53 @@ class Game:
 
         self.scores_scroll = 0
         self.name_limit_warning_until = 0.0
+        return True
+
+    def fleet_source(self):
+        # Replays and network games may have switched the board size or fleet.
+        pool = self.fleet_pool
+        if pool.size != self.grid_size or pool.fleet != self.fleet:
+            pool.close()
+            pool = self.fleet_pool = FleetPool(self.grid_size, self.fleet).start()
+        return pool
 
     def run(self):
         running = True
+        profiler = self.profiler
         while running:
-            self.clock.tick(FPS)
+            profiler.begin()
+            wait = self.idle_timeout() if self.idle_pacing else 0.0
+            if wait > 0:
+                # Nothing is animating: sleep until input or the next deadline.
+                first = pygame.event.wait(max(1, int(wait * 1000)))
+                events = pygame.event.get()
+                if first.type != pygame.NOEVENT:
+                    events.insert(0, first)
+                self.clock.tick()
+            else:
+                self.clock.tick(FPS)
+                events = pygame.event.get()
+            self.scheduler.tick()
             mouse_pos = pygame.mouse.get_pos()
+            profiler.mark("wait")
 
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.drawn_state = None
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.perf_overlay = not self.perf_overlay
+                    self.perf_panel = None
+                    self.drawn_state = None
+                    continue
 
                 if self.state == "menu":
                     running = self.handle_menu(event)
                 elif self.state == "coin":
                     self.handle_coin(event)
+                elif self.state == "wait":
+                    self.handle_wait(event)
                 elif self.state == "play":
                     self.handle_play(event)
                 elif self.state == "scores":
@@ -223,16 +425,57 @@ class Game:
                 elif self.state == "gameover":
                     running = self.handle_gameover(event)
 
-            if self.state == "coin":
-                self.update_coin()
-            if self.state == "play":
-                self.update_play()
-
-            self.draw(mouse_pos)
-            pygame.display.flip()
-
+            profiler.mark("events")
+
+            self.scheduler.run_due()
+            self.update()
+            profiler.mark("update")
+
+            rects = self.draw(mouse_pos)
+            if self.perf_overlay:
+                rect = self.draw_perf_overlay()
+                if rects is not None:
+                    rects.append(rect)
+            profiler.mark("draw")
+
+            if rects is None:
+                pygame.display.flip()
+            elif rects:
+                pygame.display.update(rects)
+            profiler.mark("flip")
+            profiler.end(self.state)
+
+        profiler.close()
+        self.stop_recording()
+        self.stop_network()
+        self.thinker.shutdown()
+        self.fleet_pool.close()
         pygame.quit()
 
+    def update(self):
+        if self.state == "wait":
+            self.update_net()
+        if self.state == "play":
+            self.update_play()
+
+    def fast_forward(self, seconds):
+        # Headless runs on a VirtualClock: jump from timer to timer, updating
+        # the game at each one as a frame would.
+        self.scheduler.advance(seconds, self.update)
+
+    def idle_timeout(self):
+        # Seconds the loop may sleep before something on screen has to change;
+        # 0 means an animation is running and frames are paced at FPS. Every
+        # other deadline is a scheduler timer; a move still being computed
+        # wakes the loop with AI_EVENT.
+        if self.state == "play" and self.replay and not self.replay_paused and not self.replay.done():
+            return 0.0
+        anim = self.shot_anim
+        if anim and (self.state == "play" or self.scheduler.now - anim["start"] <= self.anim_duration):
+            # Animating, or one more frame to draw the cell without it.
+            return 0.0
+        return self.scheduler.timeout(IDLE_MAX_WAIT)
+
     # ---------- State handlers ----------
     def handle_menu(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
@@ -240,8 +483,8 @@ class Game:
                 if btn.is_clicked(event):
                     self.sounds.play("click")
                     if btn.text == "Новая игра":
-                        self.reset_game()
-                        self.state = "coin"
+                        if self.reset_game():
+                            self.state = "coin"
                     elif btn.text == "Рекорды":
                         self.scores_scroll = 0
                         self.state = "scores"
@@ -256,16 +499,39 @@ class Game:
                     self.sounds.play("coin")
                     self.coin_result = random.choice(["player", "ai"])
                     self.current_turn = self.coin_result
-                    self.coin_time = time.time()
+                    self.coin_timer = self.scheduler.call_later(self.coin_delay, self.finish_coin)
         return True
 
-    def update_coin(self):
-        if self.coin_result is not None and time.time() - self.coin_time > 1.2:
-            self.state = "play"
-            if self.start_time is None:
-                self.start_time = time.time()
+    def finish_coin(self):
+        self.coin_timer = None
+        self.state = "play"
+        if self.start_time is None:
+            self.start_clock()
+
+    def start_clock(self):
+        self.start_time = self.scheduler.now
+        self.end_time = None
+        self.scheduler.call_later(1.0, self.tick_clock, self.start_time, 1)
+
+    def tick_clock(self, started, second):
+        # Wakes the idle loop on every whole second so the game timer redraws.
+        if self.start_time != started or self.end_time is not None or self.state != "play":
+            return
+        # Counted rather than derived from now - started, which float rounding
+        # could leave just short of `second` and reschedule the same instant.
+        second = max(second, int(self.scheduler.now - started)) + 1
+        self.scheduler.call_at(started + second, self.tick_clock, started, second)
+
+    def handle_wait(self, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            self.stop_network()
+            self.state = "menu"
+        return True
 
     def handle_play(self, event):
+        self.handle_viewport(event)
+        if self.replay:
+            return self.handle_replay(event)
         if self.current_turn != "player":
             return True
 
@@ -274,7 +540,14 @@ class Game:
             if target is None:
                 return True
             x, y = target
+            if self.net:
+                # The server resolves the shot; wait for SHOT and TURN.
+                if self.ai.board.shots[y][x] == 0:
+                    self.net.send("FIRE", x, y)
+                    self.current_turn = "net"
+                return True
             result = self.ai.board.shoot(x, y)
+            self.record_shot(HUMAN, x, y, result)
             self.start_shot_anim("ai", x, y, result)
             self.play_shot_sound(result)
 
@@ -283,23 +556,40 @@ class Game:
                     self.game_over(player_won=True)
             elif result == "miss":
                 self.current_turn = "ai"
-                self.ai_next_action = time.time() + self.ai_think_delay
+                self.begin_ai_move()
         return True
 
     def update_play(self):
+        if self.replay:
+            self.update_replay()
+            return
+        if self.net:
+            self.update_net()
+            return
         if self.current_turn != "ai":
             return
 
-        if time.time() < self.ai_next_action:
+        task = self.ai_task
+        if task is None:
+            # The AI moves first after the coin toss.
+            task = self.begin_ai_move(delay=False)
+        if self.scheduler.now < self.ai_next_action or not task.done.is_set():
             return
-
-        shot = self.ai.choose_shot(self.player.board)
+        self.ai_task = None
+        shot = task.best
+        if task.error is not None:
+            # A strategy bug must not take the window down: log it and play
+            # the best shot found so far, or any free cell.
+            logger.error("AI move failed", exc_info=(type(task.error), task.error, task.error.__traceback__))
+            if shot is None or self.player.board.shots[shot[1]][shot[0]] != 0:
+                shot = self.player.board.random_unshot()
         if shot is None:
             self.current_turn = "player"
             return
 
         x, y = shot
         result = self.player.board.shoot(x, y)
+        self.record_shot(AI, x, y, result)
         self.start_shot_anim("player", x, y, result)
         self.play_shot_sound(result)
 
@@ -308,10 +598,87 @@ class Game:
             if self.player.board.all_sunk():
                 self.game_over(player_won=False)
                 return
-            self.ai_next_action = time.time() + self.ai_think_delay
+            self.begin_ai_move()
         else:
             self.current_turn = "player"
 
+    def begin_ai_move(self, delay=True):
+        # Thinking starts now and overlaps the minimum delay.
+        if delay:
+            self.delay_ai()
+        self.ai_task = self.thinker.start(self.ai, self.player.board, self.ai_time_budget)
+        return self.ai_task
+
+    def delay_ai(self):
+        # The next AI (or network opponent) move shows no earlier than this.
+        self.ai_next_action = self.scheduler.now + self.ai_think_delay
+        self.scheduler.call_at(self.ai_next_action)
+
+    def cancel_ai(self):
+        self.thinker.cancel()
+        self.ai_task = None
+
+    def handle_replay(self, event):
+        # Space pauses, +/- change speed, Esc leaves to the menu.
+        if event.type != pygame.KEYDOWN:
+            return True
+        index = REPLAY_SPEEDS.index(self.replay_speed)
+        if event.key == pygame.K_ESCAPE:
+            self.replay = None
+            self.state = "menu"
+        elif event.key == pygame.K_SPACE:
+            self.replay_paused = not self.replay_paused
+            self.replay_tick = self.scheduler.now
+        elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+            self.replay_speed = REPLAY_SPEEDS[min(index + 1, len(REPLAY_SPEEDS) - 1)]
+        elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            self.replay_speed = REPLAY_SPEEDS[max(index - 1, 0)]
+        else:
+            return True
+        self.drawn_state = None
+        return True
+
+    def update_replay(self):
+        replay = self.replay
+        now = self.scheduler.now
+        if self.replay_paused or replay.done():
+            self.replay_tick = now
+            return
+        if self.replay_speed == float("inf"):
+            target = float("inf")
+        else:
+            target = replay.clock + (now - self.replay_tick) * 1000 * self.replay_speed
+        self.replay_tick = now
+        shot = replay.advance(target)
+        if shot is not None:
+            shooter, x, y, result = shot
+            self.start_shot_anim("ai" if shooter == HUMAN else "player", x, y, result)
+            self.play_shot_sound(result)
+        if replay.done():
+            # Redraw once so the header shows the end of the replay.
+            self.drawn_state = None
+
+    def handle_viewport(self, event):
+        # Mouse wheel zooms the board under the cursor, right-drag scrolls it.
+        if event.type == pygame.MOUSEWHEEL:
+            hit = self.board_at(pygame.mouse.get_pos())
+            if hit is not None:
+                renderer, local = hit
+                renderer.zoom(event.y, local)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+            hit = self.board_at(event.pos)
+            if hit is not None:
+                self.pan_origin = (hit[0], event.pos)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+            self.pan_origin = None
+        elif event.type == pygame.MOUSEMOTION and self.pan_origin is not None:
+            renderer, (ox, oy) = self.pan_origin
+            dx = (ox - event.pos[0]) // renderer.cell_size
+            dy = (oy - event.pos[1]) // renderer.cell_size
+            if dx or dy:
+                renderer.pan(dx, dy)
+                self.pan_origin = (renderer, (ox - dx * renderer.cell_size, oy - dy * renderer.cell_size))
+
     def handle_scores(self, event):
         if event.type == pygame.MOUSEWHEEL:
             self.scores_scroll -= event.y
@@ -328,12 +695,12 @@ class Game:
                         if btn.text == "Назад":
                             self.state = "menu"
 
-        records = self.score_manager.records
+        total = self.score_manager.count()
         row_h = 32
         list_top = 132
         list_bottom = SCREEN_HEIGHT - 130
         visible = max(1, (list_bottom - list_top) // row_h)
-        max_scroll = max(0, len(records) - visible)
+        max_scroll = max(0, total - visible)
         self.scores_scroll = max(0, min(self.scores_scroll, max_scroll))
         return True
 
@@ -349,7 +716,9 @@ class Game:
                     if len(self.name_input) < self.max_name_len:
                         self.name_input += event.unicode
                     else:
-                        self.name_limit_warning_until = time.time() + 1.6
+                        self.name_limit_warning_until = self.scheduler.now + 1.6
+                        # Redraw once the warning expires.
+                        self.scheduler.call_at(self.name_limit_warning_until)
 
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             if self.player_won and self.gameover_ok_button().is_clicked(event):
@@ -361,8 +730,8 @@ class Game:
                 if btn.is_clicked(event):
                     self.sounds.play("click")
                     if btn.text == "Начать сначала":
-                        self.reset_game()
-                        self.state = "coin"
+                        if self.reset_game():
+                            self.state = "coin"
                     elif btn.text == "Рекорды":
                         self.scores_scroll = 0
                         self.state = "scores"
@@ -374,11 +743,133 @@ class Game:
 
     # ---------- Actions ----------
     def game_over(self, player_won):
+        self.stop_recording()
+        self.cancel_ai()
         self.player_won = player_won
-        self.end_time = time.time()
+        self.end_time = self.scheduler.now
         self.state = "gameover"
         self.sounds.play("win" if player_won else "lose")
 
+    def start_recording(self):
+        if not self.record:
+            return
+        path = os.path.join(self.replay_dir, time.strftime("%Y%m%d-%H%M%S") + f"-{self.seed:016x}.sbr")
+        try:
+            os.makedirs(self.replay_dir, exist_ok=True)
+            self.recorder = GameRecorder(
+                path, self.grid_size, self.seed, [self.player.board, self.ai.board], clock=self.scheduler.clock
+            )
+        except OSError:
+            # Unwritable location: play on without a record.
+            self.recorder = None
+
+    def record_shot(self, shooter, x, y, result):
+        if self.recorder is None or result == "repeat":
+            return
+        try:
+            self.recorder.shot(shooter, x, y, result)
+        except OSError:
+            self.stop_recording()
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def start_network(self, host, port, mode="ai", join=None):
+        # Raises OSError when the server cannot be reached.
+        self.stop_network()
+        self.net = NetClient(host, port, notify=lambda: pygame.event.post(pygame.event.Event(NET_EVENT)))
+        self.net_match = None
+        self.net_error = None
+        self.net_inbox.clear()
+        if join is not None:
+            self.net.send("JOIN", join)
+        else:
+            self.net.send("NEW", mode)
+        self.state = "wait"
+
+    def stop_network(self):
+        if self.net is not None:
+            self.net.close()
+            self.net = None
+        self.net_inbox.clear()
+
+    def update_net(self):
+        self.net_inbox.extend(self.net.poll())
+        while self.net and self.net_inbox:
+            parts = self.net_inbox[0]
+            cmd = parts[0]
+            if cmd == "SHOT" and parts[1] == "them" and self.scheduler.now < self.ai_next_action:
+                return
+            self.net_inbox.popleft()
+            if cmd == "MATCH":
+                self.net_match = parts[1]
+            elif cmd == "START":
+                self.start_net_game(int(parts[1]), parts[2] == "you", parse_fleet(parts[3]))
+            elif cmd == "FLEET":
+                self.player.board.place_fleet(fleet_placements(parse_records(parts[1:]), self.grid_size))
+            elif cmd == "TURN":
+                self.current_turn = "player"
+            elif cmd == "SHOT":
+                self.apply_net_shot(parts[1] == "you", int(parts[2]), int(parts[3]), parts[4], parse_records(parts[5:]))
+            elif cmd == "OVER":
+                self.stop_network()
+                if parts[1] == "abandoned":
+                    self.state = "menu"
+                else:
+                    self.game_over(player_won=parts[1] == "win")
+            elif cmd == "CLOSED":
+                self.stop_network()
+                self.state = "menu"
+            elif cmd == "ERR":
+                self.net_error = " ".join(parts[1:])
+                self.drawn_state = None
+                if self.current_turn == "net":
+                    self.current_turn = "player"
+
+    def start_net_game(self, size, first, fleet):
+        self.stop_recording()
+        self.grid_size = size
+        self.fleet = fleet
+        self.player = Player(size, fleet)
+        self.ai = Player(size, fleet)
+        self.current_turn = "player" if first else "ai"
+        self.start_clock()
+        self.name_input = ""
+        self.saved = False
+        self.player_won = False
+        self.shot_anim = None
+        self.ai_next_action = 0.0
+        self.state = "play"
+
+    def apply_net_shot(self, mine, x, y, result, cells):
+        if result == "repeat":
+            return
+        if mine:
+            self.ai.board.apply_result(x, y, result, cells)
+            self.start_shot_anim("ai", x, y, result)
+            if result == "miss":
+                self.current_turn = "ai"
+                self.delay_ai()
+        else:
+            self.player.board.shoot(x, y)
+            self.start_shot_anim("player", x, y, result)
+            self.delay_ai()
+        self.play_shot_sound(result)
+
+    def start_replay(self, path, speed=1.0):
+        log = GameLog.load(path)
+        self.grid_size = log.size
+        self.fleet = log.fleet
+        self.reset_game(log)
+        # Slowest listed speed that is at least the requested one.
+        self.replay_speed = next((s for s in REPLAY_SPEEDS if s >= speed), REPLAY_SPEEDS[-1])
+        self.replay_paused = False
+        self.replay_tick = self.scheduler.now
+        self.state = "play"
+        self.start_clock()
+
     def play_shot_sound(self, result):
         if result == "miss":
             self.sounds.play("miss")
@@ -400,79 +891,188 @@ class Game:
 
     # ---------- Drawing ----------
     def draw(self, mouse_pos):
+        # Returns the changed screen rects, or None when the whole frame was redrawn.
+        if self.state == "play" and self.drawn_state == "play":
+            return self.draw_play(mouse_pos, full=False)
+        self.drawn_state = self.state
+
         self.draw_background(play_state=self.state == "play")
 
         if self.state == "menu":
             self.draw_menu(mouse_pos)
         elif self.state == "coin":
             self.draw_coin(mouse_pos)
+        elif self.state == "wait":
+            self.draw_wait(mouse_pos)
         elif self.state == "play":
             self.draw_play(mouse_pos)
         elif self.state == "scores":
             self.draw_scores(mouse_pos)
         elif self.state == "gameover":
             self.draw_gameover(mouse_pos)
+        return None
+
+    def draw_perf_overlay(self):
+        # The panel is opaque and always blitted to the same spot, so an
+        # incremental frame only needs its rect; the text refreshes 4x a second.
+        now = time.perf_counter()
+        if self.perf_panel is None or now - self.perf_panel_at >= 0.25:
+            self.perf_panel = self.build_perf_panel()
+            self.perf_panel_at = now
+        return self.screen.blit(self.perf_panel, (4, 4))
+
+    def build_perf_panel(self):
+        stats = self.profiler.summary(self.state)
+        if stats is None:
+            lines = ["FPS --"]
+        else:
+            phases = stats["phases"]
+            lines = [
+                f"FPS {stats['fps']:5.1f}",
+                f"frame p50 {stats['p50']:6.2f}  p99 {stats['p99']:6.2f}  max {stats['max']:6.2f} ms",
+                f"events {phases['events']:6.2f}  update {phases['update']:6.2f} ms",
+                f"draw[{self.state}] {phases['draw']:6.2f}  flip {phases['flip']:6.2f} ms",
+                f"idle {phases['wait']:7.2f} ms",
+            ]
+        sounds = self.sounds.stats()
+        lines.append(
+            f"sounds {sounds['sounds']} (cached {sounds['cache_hits']})  startup {sounds['startup_ms']:6.1f} ms"
+        )
+        # Numbers change every refresh, so bypass the shared text cache.
+        surfs = [self.small_font.render(line, True, BLACK) for line in lines]
+        width = max(s.get_width() for s in surfs) + 12
+        if self.perf_panel is not None:
+            # Never shrink: an incremental frame would leave the old edge behind.
+            width = max(width, self.perf_panel.get_width())
+        panel = pygame.Surface((width, sum(s.get_height() for s in surfs) + 8))
+        panel.fill(WHITE)
+        pygame.draw.rect(panel, DARK, panel.get_rect(), 1)
+        y = 4
+        for surf in surfs:
+            panel.blit(surf, (6, y))
+            y += surf.get_height()
+        return panel
 
     def draw_background(self, play_state=False):
+        self.screen.blit(self.background(play_state), (0, 0))
+
+    def background(self, play_state):
+        surf = self.backgrounds.get(play_state)
+        if surf is not None:
+            return surf
+
+        surf = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.backgrounds[play_state] = surf
         if play_state:
-            self.screen.fill(BG_RIGHT)
+            surf.fill(BG_RIGHT)
             left_width = SCREEN_WIDTH // 2
-            pygame.draw.rect(self.screen, BG_LEFT, (0, 0, left_width, SCREEN_HEIGHT))
+            pygame.draw.rect(surf, BG_LEFT, (0, 0, left_width, SCREEN_HEIGHT))
             divider_x = left_width
-            pygame.draw.line(self.screen, BG_DIVIDER, (divider_x, 0), (divider_x, SCREEN_HEIGHT), 2)
-            pygame.draw.line(self.screen, (24, 25, 29), (divider_x - 2, 0), (divider_x - 2, SCREEN_HEIGHT), 1)
-            pygame.draw.line(self.screen, (14, 15, 18), (divider_x + 2, 0), (divider_x + 2, SCREEN_HEIGHT), 1)
-            return
+            pygame.draw.line(surf, BG_DIVIDER, (divider_x, 0), (divider_x, SCREEN_HEIGHT), 2)
+            pygame.draw.line(surf, (24, 25, 29), (divider_x - 2, 0), (divider_x - 2, SCREEN_HEIGHT), 1)
+            pygame.draw.line(surf, (14, 15, 18), (divider_x + 2, 0), (divider_x + 2, SCREEN_HEIGHT), 1)
+            return surf
 
         side_width = SCREEN_WIDTH // 4
         center_width = SCREEN_WIDTH // 2
-        self.screen.fill(BG_LEFT)
-        pygame.draw.rect(self.screen, BG_RIGHT, (side_width, 0, center_width, SCREEN_HEIGHT))
+        surf.fill(BG_LEFT)
+        pygame.draw.rect(surf, BG_RIGHT, (side_width, 0, center_width, SCREEN_HEIGHT))
 
         left_edge = side_width
         right_edge = side_width + center_width
-        pygame.draw.line(self.screen, BG_DIVIDER, (left_edge, 0), (left_edge, SCREEN_HEIGHT), 2)
-        pygame.draw.line(self.screen, BG_DIVIDER, (right_edge, 0), (right_edge, SCREEN_HEIGHT), 2)
-        pygame.draw.line(self.screen, (24, 25, 29), (left_edge - 2, 0), (left_edge - 2, SCREEN_HEIGHT), 1)
-        pygame.draw.line(self.screen, (24, 25, 29), (right_edge + 2, 0), (right_edge + 2, SCREEN_HEIGHT), 1)
+        pygame.draw.line(surf, BG_DIVIDER, (left_edge, 0), (left_edge, SCREEN_HEIGHT), 2)
+        pygame.draw.line(surf, BG_DIVIDER, (right_edge, 0), (right_edge, SCREEN_HEIGHT), 2)
+        pygame.draw.line(surf, (24, 25, 29), (left_edge - 2, 0), (left_edge - 2, SCREEN_HEIGHT), 1)
+        pygame.draw.line(surf, (24, 25, 29), (right_edge + 2, 0), (right_edge + 2, SCREEN_HEIGHT), 1)
+        return surf
+
+    def restore_background(self, rect):
+        self.screen.blit(self.background(self.state == "play"), rect, rect)
 
     def draw_menu(self, mouse_pos):
-        title = self.title_font.render("Морской бой", True, BLACK)
+        title = render_text(self.title_font, "Морской бой", BLACK)
         self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 40)))
         for btn in self.menu_buttons():
             btn.draw(self.screen, mouse_pos)
+        if self.fleet_error:
+            error = render_text(self.small_font, self.fleet_error, RED)
+            self.screen.blit(error, error.get_rect(center=(SCREEN_WIDTH // 2, 460)))
 
     def draw_coin(self, mouse_pos):
-        title = self.title_font.render("Бросок монетки", True, BLACK)
+        title = render_text(self.title_font, "Бросок монетки", BLACK)
         self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 40)))
         if self.coin_result is None:
             for btn in self.coin_buttons():
                 btn.draw(self.screen, mouse_pos)
         else:
             result_text = "Орёл — первым ходит игрок" if self.coin_result == "player" else "Решка — первым ходит компьютер"
-            text = self.font.render(result_text, True, BLACK)
+            text = render_text(self.font, result_text, BLACK)
             self.screen.blit(text, text.get_rect(center=(SCREEN_WIDTH // 2, 140)))
             pygame.draw.circle(self.screen, BLUE, (SCREEN_WIDTH // 2, 220), 50)
 
-    def draw_play(self, mouse_pos):
-        elapsed = int((self.end_time or time.time()) - self.start_time) if self.start_time else 0
-        timer = self.timer_font.render(f"{elapsed // 60:02d}:{elapsed % 60:02d}", True, BLACK)
-        self.screen.blit(timer, timer.get_rect(center=(SCREEN_WIDTH // 2, 40)))
-
-        self.draw_board(self.player.board, MARGIN, TOP, show_ships=True)
-        self.draw_board(self.ai.board, MARGIN + BOARD_SIZE + GAP, TOP, show_ships=False)
-
-        label_player = self.font.render("Игрок", True, BLACK)
-        label_ai = self.font.render("Компьютер", True, BLACK)
-        self.screen.blit(label_player, (MARGIN, TOP - 30))
-        self.screen.blit(label_ai, (MARGIN + BOARD_SIZE + GAP, TOP - 30))
+    def draw_wait(self, mouse_pos):
+        title = render_text(self.title_font, "Сетевая игра", BLACK)
+        self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 40)))
+        text = "Подключение..." if self.net_match is None else f"Матч {self.net_match}: ожидание соперника"
+        line = render_text(self.font, text, BLACK)
+        self.screen.blit(line, line.get_rect(center=(SCREEN_WIDTH // 2, 140)))
+        hint = render_text(self.small_font, "Esc — в меню", DARK)
+        self.screen.blit(hint, hint.get_rect(center=(SCREEN_WIDTH // 2, 180)))
+        if self.net_error:
+            error = render_text(self.small_font, f"Сервер: {self.net_error}", RED)
+            self.screen.blit(error, error.get_rect(center=(SCREEN_WIDTH // 2, 210)))
+
+    def draw_play(self, mouse_pos, full=True):
+        rects = []
+        if self.replay:
+            elapsed = int(self.replay.clock / 1000)
+        else:
+            now = self.scheduler.now
+            elapsed = int((self.end_time or now) - self.start_time) if self.start_time is not None else 0
+        timer_text = f"{elapsed // 60:02d}:{elapsed % 60:02d}"
+        if full or timer_text != self.drawn_timer:
+            timer = render_text(self.timer_font, timer_text, BLACK)
+            rect = timer.get_rect(center=(SCREEN_WIDTH // 2, 40))
+            area = rect.union(self.timer_rect) if self.timer_rect and not full else rect
+            if not full:
+                self.restore_background(area)
+            self.screen.blit(timer, rect)
+            self.drawn_timer = timer_text
+            self.timer_rect = rect
+            rects.append(area)
+
+        rects += self.draw_board(self.player.board, MARGIN, TOP, show_ships=True, full=full)
+        rects += self.draw_board(self.ai.board, MARGIN + BOARD_SIZE + GAP, TOP, show_ships=False, full=full)
+
+        if full:
+            label_player = render_text(self.font, "Игрок", BLACK)
+            label_ai = render_text(self.font, "Компьютер", BLACK)
+            self.screen.blit(label_player, (MARGIN, TOP - 30))
+            self.screen.blit(label_ai, (MARGIN + BOARD_SIZE + GAP, TOP - 30))
+            if self.replay:
+                self.draw_replay_label()
+            elif self.net is not None and self.net_error:
+                error = render_text(self.small_font, f"Сервер: {self.net_error}", RED)
+                self.screen.blit(error, error.get_rect(midleft=(SCREEN_WIDTH // 2 + 60, 40)))
 
         status_y = TOP + BOARD_SIZE + 40
-        self.draw_fleet_status(self.player.board, MARGIN, status_y, "Ваши корабли")
-        self.draw_fleet_status(self.ai.board, MARGIN + BOARD_SIZE + GAP, status_y, "Корабли врага")
+        rects += self.draw_fleet_status(self.player.board, MARGIN, status_y, "Ваши корабли", full)
+        rects += self.draw_fleet_status(self.ai.board, MARGIN + BOARD_SIZE + GAP, status_y, "Корабли врага", full)
+        return rects
+
+    def draw_replay_label(self):
+        speed = "max" if self.replay_speed == float("inf") else f"x{self.replay_speed:g}"
+        if self.replay.done():
+            text = "Повтор завершён — Esc"
+        elif self.replay_paused:
+            text = f"Повтор {speed}, пауза"
+        else:
+            text = f"Повтор {speed}"
+        label = render_text(self.small_font, text, DARK)
+        self.screen.blit(label, label.get_rect(midleft=(SCREEN_WIDTH // 2 + 60, 40)))
 
     def draw_scores(self, mouse_pos):
-        title = self.title_font.render("Рекорды", True, BLACK)
+        title = render_text(self.title_font, "Рекорды", BLACK)
         self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 68)))
 
         center_left = SCREEN_WIDTH // 4
@@ -488,34 +1088,33 @@ class Game:
         list_bottom = SCREEN_HEIGHT - 130
         row_h = 32
 
-        self.screen.blit(self.small_font.render("№", True, BLACK), (col_num, list_top - 30))
-        self.screen.blit(self.small_font.render("Time", True, BLACK), (col_time, list_top - 30))
-        self.screen.blit(self.small_font.render("Name", True, BLACK), (col_name, list_top - 30))
+        self.screen.blit(render_text(self.small_font, "№", BLACK), (col_num, list_top - 30))
+        self.screen.blit(render_text(self.small_font, "Time", BLACK), (col_time, list_top - 30))
+        self.screen.blit(render_text(self.small_font, "Name", BLACK), (col_name, list_top - 30))
         pygame.draw.line(self.screen, DARK, (table_x, list_top - 8), (table_x + table_w, list_top - 8), 1)
 
-        records = self.score_manager.records
+        total = self.score_manager.count()
         visible = max(1, (list_bottom - list_top) // row_h)
-        max_scroll = max(0, len(records) - visible)
+        max_scroll = max(0, total - visible)
         self.scores_scroll = max(0, min(self.scores_scroll, max_scroll))
 
-        if not records:
-            text = self.font.render("Пока нет рекордов", True, BLACK)
+        if not total:
+            text = render_text(self.font, "Пока нет рекордов", BLACK)
             self.screen.blit(text, text.get_rect(center=(SCREEN_WIDTH // 2, list_top + 24)))
         else:
             start = self.scores_scroll
-            end = min(len(records), start + visible)
+            records = self.score_manager.top(visible, start)
             y = list_top
-            for i in range(start, end):
-                rec = records[i]
+            for i, rec in enumerate(records, start):
                 time_val = rec.get("time") or self.score_manager.format_time(rec.get("seconds", 0))
                 name_val = str(rec.get("name", ""))
-                self.screen.blit(self.small_font.render(str(i + 1), True, BLACK), (col_num, y))
-                self.screen.blit(self.small_font.render(time_val, True, BLACK), (col_time, y))
-                self.screen.blit(self.small_font.render(name_val, True, BLACK), (col_name, y))
+                self.screen.blit(render_text(self.small_font, str(i + 1), BLACK), (col_num, y))
+                self.screen.blit(render_text(self.small_font, time_val, BLACK), (col_time, y))
+                self.screen.blit(render_text(self.small_font, name_val, BLACK), (col_name, y))
                 y += row_h
 
             if max_scroll > 0:
-                hint = self.small_font.render("Колесо мыши: прокрутка", True, DARK)
+                hint = render_text(self.small_font, "Колесо мыши: прокрутка", DARK)
                 self.screen.blit(hint, (table_x, SCREEN_HEIGHT - 124))
 
         for btn in self.scores_buttons():
@@ -524,56 +1123,64 @@ class Game:
     def draw_gameover(self, mouse_pos):
         result = "WINNER" if self.player_won else "LOSER"
         color = GREEN if self.player_won else RED
-        title = self.title_font.render(result, True, color)
+        title = render_text(self.title_font, result, color)
         self.screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 68)))
 
         if self.player_won:
             input_rect = self.gameover_input_rect()
-            prompt = self.font.render("Введите имя:", True, BLACK)
+            prompt = render_text(self.font, "Введите имя:", BLACK)
             self.screen.blit(prompt, (input_rect.x, 118))
 
             pygame.draw.rect(self.screen, WHITE, input_rect)
             pygame.draw.rect(self.screen, BLACK, input_rect, 2)
-            name_surf = self.font.render(self.name_input, True, BLACK)
+            name_surf = render_text(self.font, self.name_input, BLACK)
             self.screen.blit(name_surf, (input_rect.x + 8, input_rect.y + 6))
 
             ok_btn = self.gameover_ok_button()
             ok_btn.draw(self.screen, mouse_pos)
 
             if self.saved:
-                saved = self.small_font.render("Результат записан", True, GREEN)
+                saved = render_text(self.small_font, "Результат записан", GREEN)
                 self.screen.blit(saved, saved.get_rect(midtop=(SCREEN_WIDTH // 2, input_rect.bottom + 8)))
 
-            if time.time() < self.name_limit_warning_until:
-                warn = self.small_font.render(f"Лимит имени: {self.max_name_len} символов", True, RED)
+            if self.scheduler.now < self.name_limit_warning_until:
+                warn = render_text(self.small_font, f"Лимит имени: {self.max_name_len} символов", RED)
                 self.screen.blit(warn, warn.get_rect(midtop=(SCREEN_WIDTH // 2, input_rect.bottom + 32)))
 
         for btn in self.gameover_buttons():
             btn.draw(self.screen, mouse_pos)
 
-    def draw_board(self, board, offset_x, offset_y, show_ships):
-        for y in range(GRID_SIZE):
-            for x in range(GRID_SIZE):
-                rect = pygame.Rect(offset_x + x * CELL_SIZE, offset_y + y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                pygame.draw.rect(self.screen, LIGHT_GRAY, rect)
-                pygame.draw.rect(self.screen, DARK, rect, 1)
-
-                if show_ships and board.grid[y][x] != -1:
-                    pygame.draw.rect(self.screen, SHIP_GREEN, rect)
-
-                handled = self.draw_shot_anim(board, x, y, rect)
-                if board.shots[y][x] == 1:
-                    pygame.draw.circle(self.screen, BLUE, rect.center, 4)
-                elif board.shots[y][x] == 2 and not handled:
-                    pygame.draw.rect(self.screen, RED, rect)
+    def draw_board(self, board, offset_x, offset_y, show_ships, full=True):
+        renderer = self.board_renderers[show_ships]
+        anim_cell = self.shot_anim_cell(board)
+        cells = renderer.dirty_cells(board, anim_cell)
+        for x, y in cells:
+            rect = renderer.draw_cell(board, x, y, hide_hit=(x, y) == anim_cell)
+            if (x, y) == anim_cell:
+                self.draw_shot_anim(renderer.surface, rect)
+
+        board_rect = pygame.Rect(offset_x, offset_y, BOARD_SIZE, BOARD_SIZE)
+        if full or renderer.repainted:
+            self.screen.blit(renderer.surface, board_rect)
+            return [board_rect]
+
+        rects = []
+        for x, y in cells:
+            rect = renderer.cell_rect(x, y)
+            screen_rect = rect.move(offset_x, offset_y).clip(board_rect)
+            self.screen.blit(renderer.surface, screen_rect, rect)
+            rects.append(screen_rect)
+        return rects
 
     def remaining_counts(self, board):
-        counts = {1: 0, 2: 0, 3: 0, 4: 0}
+        # Counted from the fleet rather than board.ships: a network opponent's
+        # board only learns a ship once it is sunk.
+        counts = {}
+        for size in board.fleet:
+            counts[size] = counts.get(size, 0) + 1
         for ship in board.ships:
-            if not ship.is_sunk():
-                size = len(ship.cells)
-                if size in counts:
-                    counts[size] += 1
+            if ship.is_sunk():
+                counts[len(ship.cells)] -= 1
         return counts
 
     def start_shot_anim(self, target, x, y, result):
@@ -582,41 +1189,55 @@ class Game:
             "x": x,
             "y": y,
             "result": result,
-            "start": time.time(),
+            "start": self.scheduler.now,
         }
 
-    def draw_shot_anim(self, board, x, y, rect):
+    def shot_anim_cell(self, board):
         if not self.shot_anim:
-            return False
+            return None
+
+        if self.scheduler.now - self.shot_anim["start"] > self.anim_duration:
+            self.shot_anim = None
+            return None
 
         target_board = self.player.board if self.shot_anim["target"] == "player" else self.ai.board
         if board is not target_board:
-            return False
-        if self.shot_anim["x"] != x or self.shot_anim["y"] != y:
-            return False
-
-        elapsed = time.time() - self.shot_anim["start"]
-        if elapsed > self.anim_duration:
-            self.shot_anim = None
-            return False
+            return None
+        return self.shot_anim["x"], self.shot_anim["y"]
 
-        t = elapsed / self.anim_duration
+    def draw_shot_anim(self, surface, rect):
+        elapsed = self.scheduler.now - self.shot_anim["start"]
+        t = min(1.0, elapsed / self.anim_duration)
+        cell = rect.width
         if self.shot_anim["result"] in ["hit", "sunk"]:
-            radius = max(2, int((CELL_SIZE / 2 - 1) * t))
-            pygame.draw.circle(self.screen, RED, rect.center, radius)
+            radius = max(2, int((cell / 2 - 1) * t))
+            pygame.draw.circle(surface, RED, rect.center, radius)
         else:
-            radius = int(4 + (CELL_SIZE / 2 - 4) * (1 - t))
-            pygame.draw.circle(self.screen, BLUE, rect.center, max(3, radius), 2)
-        return True
-
-    def draw_fleet_status(self, board, offset_x, y, label):
-        label_surf = self.small_font.render(label, True, BLACK)
-        self.screen.blit(label_surf, (offset_x, y - 22))
+            radius = int(4 + (cell / 2 - 4) * (1 - t))
+            pygame.draw.circle(surface, BLUE, rect.center, max(3, radius), 2)
+
+    def draw_fleet_status(self, board, offset_x, y, label, full=True):
+        # Counts only change when a ship sinks or a new fleet is placed.
+        key = (board.ships, board.sunk_count)
+        drawn = self.drawn_fleet.get(label)
+        if not full and drawn is not None and drawn[0] is key[0] and drawn[1] == key[1]:
+            return []
+        self.drawn_fleet[label] = key
 
         counts = self.remaining_counts(board)
-        sizes = [4, 3, 2, 1]
-        cell = max(10, CELL_SIZE // 2)
-        row_h = cell + 8
+        sizes = sorted(counts, reverse=True)
+        # Custom fleets can have longer ships and more rows than the classic one.
+        cell = max(4, min(CELL_SIZE // 2, (BOARD_SIZE - 70) // max(sizes, default=1)))
+        rows = max(4, len(sizes))
+        row_h = max(cell + 2, min(cell + 8, (SCREEN_HEIGHT - y - 4) // rows))
+        cell = min(cell, row_h - 2)
+
+        area = pygame.Rect(offset_x, y - 22, BOARD_SIZE, 22 + rows * row_h)
+        if not full:
+            self.restore_background(area)
+
+        label_surf = render_text(self.small_font, label, BLACK)
+        self.screen.blit(label_surf, (offset_x, y - 22))
 
         row_index = 0
         for size in sizes:
@@ -632,8 +1253,9 @@ class Game:
                 x = offset_x + i * cell
                 pygame.draw.line(self.screen, DARK, (x, row_y), (x, row_y + cell), 1)
 
-            count_text = self.small_font.render(f"={counts[size]}", True, BLACK)
+            count_text = render_text(self.small_font, f"={counts[size]}", BLACK)
             self.screen.blit(count_text, (offset_x + cell * size + 8, row_y + 1))
+        return [area]
 
     # ---------- UI helpers ----------
     def _distributed_buttons(self, labels, y_start, y_end, width=280, height=50):
@@ -686,9 +1308,15 @@ class Game:
         x, y = pos
         if not (offset_x <= x < offset_x + BOARD_SIZE and offset_y <= y < offset_y + BOARD_SIZE):
             return None
-        gx = (x - offset_x) // CELL_SIZE
-        gy = (y - offset_y) // CELL_SIZE
-        return int(gx), int(gy)
+        return self.board_renderers[not enemy].cell_at((x - offset_x, y - offset_y))
+
+    def board_at(self, pos):
+        for enemy in (False, True):
+            offset_x = MARGIN + BOARD_SIZE + GAP if enemy else MARGIN
+            x, y = pos
+            if offset_x <= x < offset_x + BOARD_SIZE and TOP <= y < TOP + BOARD_SIZE:
+                return self.board_renderers[not enemy], (x - offset_x, y - TOP)
+        return None
 
 
 if __name__ == "__main__":
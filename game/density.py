@@ -0,0 +1,90 @@
+﻿import numpy as np
+
+# All helpers work on the last two axes, so the same code serves one board
+# (rows, cols) and a stack of boards (games, rows, cols).
+
+
+def _window_sums(arr, size):
+    # Sum of every run of `size` consecutive cells along each row.
+    csum = np.zeros(arr.shape[:-1] + (arr.shape[-1] + 1,), dtype=arr.dtype)
+    np.cumsum(arr, axis=-1, out=csum[..., 1:])
+    return csum[..., size:] - csum[..., :-size]
+
+
+def _box_sums(arr, height, width):
+    # Sum of every height x width box, with arr already padded by one cell.
+    sat = np.zeros(arr.shape[:-2] + (arr.shape[-2] + 1, arr.shape[-1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(arr, axis=-2), axis=-1, out=sat[..., 1:, 1:])
+    return sat[..., height:, width:] - sat[..., :-height, width:] - sat[..., height:, :-width] + sat[..., :-height, :-width]
+
+
+def _row_density(blocked, open_hits, open_padded, size, targeting):
+    cols = blocked.shape[-1]
+    if size > cols:
+        return np.zeros(blocked.shape, dtype=np.int64)
+
+    clear = _window_sums(blocked, size) == 0
+    covered = _window_sums(open_hits, size)
+    # Hits in the halo of a placement would belong to a touching ship.
+    halo = _box_sums(open_padded, 3, size + 2) - covered
+    valid = clear & (halo == 0)
+    weight = np.where(valid, np.where(targeting, covered, 1), 0).astype(np.int64)
+
+    padded = np.zeros(blocked.shape[:-1] + (cols + size - 1,), dtype=np.int64)
+    padded[..., size - 1 : cols] = weight
+    return _window_sums(padded, size)
+
+
+def _transposed(arr):
+    return np.ascontiguousarray(np.swapaxes(arr, -1, -2))
+
+
+def density_counts(blocked, open_hits, remaining, targeting):
+    # blocked/open_hits are int32 arrays; remaining yields (ship size, count)
+    # where count may be an array broadcasting over a stack of boards, and
+    # targeting (bool or such an array) restricts counting to placements
+    # through open hits.
+    pad = [(0, 0)] * (open_hits.ndim - 2) + [(1, 1), (1, 1)]
+    open_padded = np.pad(open_hits, pad)
+    open_padded_t = _transposed(open_padded)
+    blocked_t = _transposed(blocked)
+    open_hits_t = _transposed(open_hits)
+    targeting_t = np.swapaxes(targeting, -1, -2) if np.ndim(targeting) >= 2 else targeting
+
+    counts = np.zeros(blocked.shape, dtype=np.int64)
+    for ship_size, count in remaining:
+        dens = _row_density(blocked, open_hits, open_padded, ship_size, targeting)
+        if ship_size > 1:
+            dens_t = _row_density(blocked_t, open_hits_t, open_padded_t, ship_size, targeting_t)
+            dens = dens + np.swapaxes(dens_t, -1, -2)
+        counts += dens * count
+    return counts
+
+
+def density_map(shots, sunk, remaining, size, window=None):
+    # shots are Board.shots rows (0 unknown, 1 miss, 2 hit; bytearray or
+    # SparseRow), sunk holds the (x, y) hits of ships already sunk and
+    # remaining maps ship size -> count. While a wounded ship is on the board
+    # only placements through its hits are counted. window=(x0, y0, x1, y1)
+    # limits the counts to that half-open box (large boards); cells outside it
+    # are treated as off the board.
+    if window is None:
+        x0, y0, x1, y1 = 0, 0, size, size
+        shots = np.frombuffer(b"".join(map(bytes, shots)), dtype=np.int8).reshape(size, size)
+    else:
+        x0, y0, x1, y1 = window
+        rows = [shots[y] for y in range(y0, y1)]
+        shots = np.array([[row[x] for x in range(x0, x1)] for row in rows], dtype=np.int8)
+    sunk_cells = np.zeros(shots.shape, dtype=bool)
+    sunk = [(x - x0, y - y0) for x, y in sunk if x0 <= x < x1 and y0 <= y < y1]
+    if sunk:
+        xs, ys = zip(*sunk)
+        sunk_cells[list(ys), list(xs)] = True
+    sunk = sunk_cells
+    blocked = ((shots == 1) | sunk).astype(np.int32)
+    open_hits = ((shots == 2) & ~sunk).astype(np.int32)
+    targeting = bool(open_hits.any())
+
+    counts = density_counts(blocked, open_hits, remaining.items(), targeting)
+    counts[shots != 0] = -1
+    return counts
@@ -0,0 +1,299 @@
+﻿import argparse
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from .board import check_fleet, random_fleet
+from .config import GRID_SIZE, BITBOARD_LIMIT, CACHE_DIR, default_fleet, parse_fleet
+from .replay import fleet_placements, placement_cells
+
+# Pre-generated fleets. File layout (little-endian):
+#   header   magic, version, grid size, ships per fleet, fleet count
+#   sizes    ships x u16, in placement order
+#   records  fleet count x ships x u32: (y * size + x) << 1 | horizontal
+MAGIC = b"SBFP"
+VERSION = 1
+HEADER = struct.Struct("<4sBHHI")
+FLEET_DIR = CACHE_DIR
+
+
+class FleetPoolError(Exception):
+    pass
+
+
+def fleet_pool_path(size, fleet, directory=FLEET_DIR):
+    ships = "-".join(str(s) for s in fleet)
+    return os.path.join(directory, f"fleets-{size}-{ships}.bin")
+
+
+def encode_fleet(placements, size):
+    # random_fleet() output -> one u32 word per ship.
+    words = []
+    for cells, _, _ in placements:
+        x, y = min(cells)
+        horizontal = len(cells) == 1 or cells[0][1] == cells[1][1]
+        words.append((y * size + x) << 1 | horizontal)
+    return words
+
+
+def transform_ships(ships, size, t):
+    # Applies one of the 8 board symmetries to (x, y, size, horizontal) records:
+    # bit 2 swaps the axes, bits 0 and 1 mirror x and y.
+    m = size - 1
+    out = []
+    for x, y, length, horizontal in ships:
+        cells = []
+        for cx, cy in placement_cells(x, y, length, horizontal):
+            if t & 4:
+                cx, cy = cy, cx
+            if t & 1:
+                cx = m - cx
+            if t & 2:
+                cy = m - cy
+            cells.append((cx, cy))
+        cells.sort()
+        x, y = cells[0]
+        out.append((x, y, length, int(length == 1 or cells[0][1] == cells[1][1])))
+    return out
+
+
+def seeded_fleet(fleet, seed, size):
+    # The fleet FleetPool.take_seeded() hands out for `seed`.
+    return random_fleet(fleet, random.Random(seed), size)
+
+
+def default_capacity(size):
+    # 32 fleets on bitboard sizes; fewer on big boards, where one fleet takes
+    # up to seconds to generate (~1 s at 1000x1000).
+    if size <= BITBOARD_LIMIT:
+        return 32
+    return max(2, 32 * BITBOARD_LIMIT * BITBOARD_LIMIT // (size * size))
+
+
+def generate_words(args):
+    # Pool task: `count` fleets as a flat array('I').
+    size, fleet, count, seed = args
+    rng = random.Random(seed)
+    words = array("I")
+    for _ in range(count):
+        words.extend(encode_fleet(random_fleet(fleet, rng, size), size))
+    return words
+
+
+class FleetPool:
+    # Ready-made fleets for Board.place_fleet, handed out in O(1).
+    #
+    # unique: every fleet is handed out once (popped); below `low_water` a
+    #         background thread, if started, refills up to `capacity`, and an
+    #         empty pool falls back to generating inline.
+    # otherwise fleets are drawn with replacement, e.g. from a large file
+    # built offline, and never run out.
+    # rotate: apply a random board symmetry to each handout, so one stored
+    #         fleet stands for up to 8 distinct layouts.
+    # Fleets generated here are seeded_fleet() of a 32-bit seed, kept in
+    # `seeds`; take_seeded() returns both so a game can be replayed from it.
+    def __init__(self, size=GRID_SIZE, fleet=None, capacity=None, low_water=None, unique=True, rotate=False):
+        self.size = size
+        self.fleet = list(fleet) if fleet else default_fleet(size)
+        self.capacity = default_capacity(size) if capacity is None else capacity
+        self.low_water = max(2, self.capacity // 4) if low_water is None else low_water
+        self.unique = unique
+        self.rotate = rotate
+        # Flat u32 records, len(fleet) words per fleet.
+        self.words = array("I")
+        # Seeds of the last len(seeds) fleets in `words`; fleets loaded from a
+        # file have none and always come first.
+        self.seeds = array("I")
+        self.lock = threading.Lock()
+        self.wanted = threading.Event()
+        self.thread = None
+        self.closed = False
+        # Set when the fleet cannot be placed; take() raises it from then on.
+        self.error = None
+        # Seed source for new fleets; the game RNG is never touched here.
+        self.rng = random.Random(random.SystemRandom().getrandbits(64))
+
+    def __len__(self):
+        return len(self.words) // len(self.fleet)
+
+    @classmethod
+    def load(cls, path, unique=False, rotate=True):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise FleetPoolError("truncated header")
+        magic, version, size, ships, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise FleetPoolError("not a fleet pool")
+        pos = HEADER.size
+        fleet = list(struct.unpack_from(f"<{ships}H", data, pos))
+        pos += 2 * ships
+        end = pos + 4 * ships * count
+        if len(data) < end:
+            raise FleetPoolError("truncated records")
+        pool = cls(size, fleet, capacity=count, low_water=0, unique=unique, rotate=rotate)
+        pool.words.frombytes(data[pos:end])
+        if sys.byteorder != "little":
+            pool.words.byteswap()
+        return pool
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            words = array("I", self.words)
+        if sys.byteorder != "little":
+            words.byteswap()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.size, len(self.fleet), len(words) // len(self.fleet)))
+            f.write(struct.pack(f"<{len(self.fleet)}H", *self.fleet))
+            f.write(words.tobytes())
+        os.replace(tmp, path)
+
+    def fill(self, count=None):
+        # Generates up to `count` fleets (default: back to capacity) inline.
+        count = self.capacity - len(self) if count is None else count
+        for _ in range(count):
+            if self.closed:
+                break
+            seed = self.rng.getrandbits(32)
+            words = encode_fleet(seeded_fleet(self.fleet, seed, self.size), self.size)
+            with self.lock:
+                self.words.extend(words)
+                self.seeds.append(seed)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._refill, name="fleet-pool", daemon=True)
+            self.thread.start()
+            self.wanted.set()
+        return self
+
+    def _refill(self):
+        while not self.closed:
+            self.wanted.wait()
+            self.wanted.clear()
+            try:
+                self.fill()
+            except RuntimeError as exc:
+                self.error = FleetPoolError(str(exc))
+                return
+
+    def close(self):
+        self.closed = True
+        self.wanted.set()
+
+    def take(self, rng=random):
+        # One fleet as Board.place_fleet entries.
+        k = len(self.fleet)
+        with self.lock:
+            count = len(self.words) // k
+            if not count:
+                words = None
+            elif self.unique:
+                words = self.words[-k:]
+                del self.words[-k:]
+                if self.seeds:
+                    self.seeds.pop()
+                count -= 1
+            else:
+                i = rng.randrange(count) * k
+                words = self.words[i : i + k]
+        if count < self.low_water and self.thread is not None:
+            self.wanted.set()
+        if words is None:
+            return self._generate(random_fleet, rng)
+        return self._placements(words, rng)
+
+    def take_seeded(self):
+        # (seed, fleet) with fleet == seeded_fleet(self.fleet, seed, size).
+        k = len(self.fleet)
+        with self.lock:
+            seed = self.seeds.pop() if self.seeds else None
+            if seed is not None:
+                words = self.words[-k:]
+                del self.words[-k:]
+            count = len(self.seeds)
+        if count < self.low_water and self.thread is not None:
+            self.wanted.set()
+        if seed is None:
+            seed = self.rng.getrandbits(32)
+            return seed, self._generate(seeded_fleet, seed)
+        return seed, self._placements(words)
+
+    def _generate(self, make, source):
+        # Inline fallback of an empty pool; FleetPoolError if the fleet does
+        # not fit, without retrying once that is known.
+        if self.error is not None:
+            raise self.error
+        try:
+            return make(self.fleet, source, self.size)
+        except RuntimeError as exc:
+            self.error = FleetPoolError(str(exc))
+            raise self.error from None
+
+    def _placements(self, words, rng=None):
+        # Rotated only when `rng` is given: seeded fleets are handed out as built.
+        n = self.size
+        ships = []
+        for length, word in zip(self.fleet, words):
+            cell = word >> 1
+            ships.append((cell % n, cell // n, length, word & 1))
+        if self.rotate and rng is not None:
+            ships = transform_ships(ships, n, rng.randrange(8))
+        return fleet_placements(ships, n)
+
+
+_loaded = {}
+
+
+def shared_pool(path):
+    # One read-only pool per file and process, for simulation workers.
+    pool = _loaded.get(path)
+    if pool is None:
+        pool = _loaded[path] = FleetPool.load(path)
+    return pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate random fleets into a pool file")
+    parser.add_argument("--size", type=int, default=GRID_SIZE)
+    parser.add_argument("--fleet", type=parse_fleet, default=None)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help=f"default: {FLEET_DIR}/fleets-<size>-<fleet>.bin")
+    args = parser.parse_args(argv)
+
+    fleet = args.fleet or default_fleet(args.size)
+    try:
+        check_fleet(fleet, args.size)
+    except ValueError as e:
+        parser.error(f"--fleet: {e}")
+    workers = args.workers or os.cpu_count() or 1
+    chunk = 2000
+    jobs = [(args.size, fleet, min(chunk, args.count - i), args.seed + i // chunk) for i in range(0, args.count, chunk)]
+    started = time.perf_counter()
+    pool = FleetPool(args.size, fleet, capacity=args.count)
+    if workers == 1:
+        for words in map(generate_words, jobs):
+            pool.words.extend(words)
+    else:
+        with multiprocessing.Pool(workers) as procs:
+            for words in procs.imap(generate_words, jobs):
+                pool.words.extend(words)
+    path = args.out or fleet_pool_path(args.size, fleet)
+    pool.save(path)
+    elapsed = time.perf_counter() - started
+    print(f"{path}: {len(pool)} fleets, {os.path.getsize(path)} bytes, {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+﻿import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from itertools import combinations
+
+import numpy as np
+
+from .config import GRID_SIZE, BITBOARD_LIMIT, CACHE_DIR, default_fleet, parse_fleet
+
+# Opening priors: P(ship on cell) for a random_fleet() placement given the
+# first few shots, all misses. One file per grid size and fleet, layout
+# (little-endian):
+#   header  magic, version, grid size, ships, max misses, entries, samples
+#   fleet   ships x u16 ship size, largest first
+#   index   entries x (max misses x u16 canonical cells, 0xFFFF padded; u32 samples)
+#   data    entries x size*size float32, starting at a 64-byte boundary
+# Patterns are stored once per orbit of the 8 board symmetries.
+MAGIC = b"SBHM"
+VERSION = 1
+HEADER = struct.Struct("<4sBHHBII")
+NO_CELL = 0xFFFF
+HEATMAP_DIR = CACHE_DIR
+SAMPLES = 50000
+# Entries backed by fewer consistent samples are treated as missing.
+MIN_SAMPLES = 200
+
+
+class HeatmapError(Exception):
+    pass
+
+
+def default_max_misses(size):
+    return 2 if size * size <= 256 else 1
+
+
+def heatmap_path(size, fleet, directory=HEATMAP_DIR):
+    ships = "-".join(str(s) for s in sorted(fleet, reverse=True))
+    return os.path.join(directory, f"heatmap-{size}-{ships}.bin")
+
+
+def symmetries(n):
+    # perms[t][i]: where cell i lands under transform t (rotations, reflections).
+    coords = [(x, y) for y in range(n) for x in range(n)]
+    m = n - 1
+    maps = [
+        lambda x, y: (x, y),
+        lambda x, y: (m - x, y),
+        lambda x, y: (x, m - y),
+        lambda x, y: (m - x, m - y),
+        lambda x, y: (y, x),
+        lambda x, y: (m - y, x),
+        lambda x, y: (y, m - x),
+        lambda x, y: (m - y, m - x),
+    ]
+    perms = []
+    for f in maps:
+        perm = []
+        for x, y in coords:
+            tx, ty = f(x, y)
+            perm.append(ty * n + tx)
+        perms.append(perm)
+    return perms
+
+
+def canonical(cells, perms):
+    # Smallest sorted image of `cells` over all symmetries, and the transform.
+    best = None
+    best_t = 0
+    for t, perm in enumerate(perms):
+        key = tuple(sorted(perm[i] for i in cells))
+        if best is None or key < best:
+            best = key
+            best_t = t
+    return best, best_t
+
+
+class HeatmapCache:
+    # Read-only view of a prior file. The data block is memory-mapped, so
+    # every process using the same file shares one copy in the page cache.
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            raise HeatmapError("truncated header")
+        magic, version, size, ships, max_misses, entries, samples = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise HeatmapError("not a heatmap file")
+        pos = HEADER.size
+        fleet = struct.unpack_from(f"<{ships}H", self.mm, pos)
+        pos += 2 * ships
+        record = struct.Struct(f"<{max_misses}HI")
+        data_offset = _align(pos + entries * record.size)
+        if len(self.mm) < data_offset + entries * size * size * 4:
+            raise HeatmapError("truncated data")
+        self.size = size
+        self.fleet = list(fleet)
+        self.max_misses = max_misses
+        self.samples = samples
+        # canonical cells -> (entry, consistent samples)
+        self.index = {}
+        for entry, fields in enumerate(record.iter_unpack(self.mm[pos : pos + entries * record.size])):
+            key = tuple(c for c in fields[:-1] if c != NO_CELL)
+            self.index[key] = (entry, fields[-1])
+        self.data = np.frombuffer(self.mm, dtype="<f4", count=entries * size * size, offset=data_offset)
+        self.data = self.data.reshape(entries, size * size)
+        self.perms = symmetries(size)
+        self.perm_arrays = np.array(self.perms, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, misses):
+        # misses: cell indices (y * size + x). Returns a (size, size) float
+        # array of priors in board orientation, or None when not cached.
+        if len(misses) > self.max_misses:
+            return None
+        key, t = canonical(misses, self.perms)
+        found = self.index.get(key)
+        if found is None or found[1] < MIN_SAMPLES:
+            return None
+        # Cell i of this board is cell perms[t][i] of the stored orientation.
+        return self.data[found[0]][self.perm_arrays[t]].reshape(self.size, self.size)
+
+    def close(self):
+        self.data = None
+        self.mm.close()
+
+
+def _align(pos, to=64):
+    return (pos + to - 1) // to * to
+
+
+def _patterns(n, max_misses, perms):
+    canon = set()
+    for k in range(max_misses + 1):
+        for cells in combinations(range(n * n), k):
+            canon.add(canonical(cells, perms)[0])
+    return sorted(canon, key=lambda key: (len(key), key))
+
+
+def build(size, fleet, max_misses=None, samples=SAMPLES, seed=0, chunk=10000, batch=512):
+    # Returns (patterns, probabilities, consistent sample counts). Samples are
+    # rejection-filtered per pattern; every symmetric image of a pattern is
+    # evaluated too, which multiplies the effective sample count by up to 8.
+    from .batch import BatchBoards
+
+    if size > BITBOARD_LIMIT:
+        raise ValueError(f"Heatmap priors support boards up to {BITBOARD_LIMIT}x{BITBOARD_LIMIT}")
+    n2 = size * size
+    max_misses = default_max_misses(size) if max_misses is None else max_misses
+    perms = symmetries(size)
+    patterns = _patterns(size, max_misses, perms)
+    # (pattern, transform) pairs, cells padded with a column that is always free.
+    images = np.full((len(patterns) * 8, max(max_misses, 1)), n2, dtype=np.intp)
+    for p, key in enumerate(patterns):
+        for t, perm in enumerate(perms):
+            for c, cell in enumerate(key):
+                images[p * 8 + t, c] = perm[cell]
+    counts = np.zeros((len(images), n2), dtype=np.float64)
+    totals = np.zeros(len(images), dtype=np.float64)
+
+    rng = np.random.default_rng(seed)
+    left = samples
+    while left > 0:
+        step = min(chunk, left)
+        boards = BatchBoards(step, size, fleet, rng)
+        occ = (boards.ship_id >= 0).reshape(step, n2).astype(np.float32)
+        free = np.concatenate([1.0 - occ, np.ones((step, 1), dtype=np.float32)], axis=1)
+        for start in range(0, len(images), batch):
+            cells = images[start : start + batch]
+            consistent = free[:, cells[:, 0]]
+            for c in range(1, cells.shape[1]):
+                consistent = consistent * free[:, cells[:, c]]
+            counts[start : start + batch] += consistent.T @ occ
+            totals[start : start + batch] += consistent.sum(axis=0)
+        left -= step
+
+    probs = np.zeros((len(patterns), n2), dtype=np.float32)
+    support = np.zeros(len(patterns), dtype=np.int64)
+    for p in range(len(patterns)):
+        acc = np.zeros(n2)
+        total = 0.0
+        for t, perm in enumerate(perms):
+            # Counts for image t are in transformed coordinates; pull them back.
+            acc += counts[p * 8 + t][perm]
+            total += totals[p * 8 + t]
+        if total:
+            probs[p] = acc / total
+        support[p] = int(total)
+    return patterns, probs, support
+
+
+def write(path, size, fleet, max_misses, samples, patterns, probs, support):
+    # Written to a temporary file and renamed, so concurrent builders and
+    # readers never see a partial file.
+    fleet = sorted(fleet, reverse=True)
+    record = struct.Struct(f"<{max_misses}HI")
+    parts = [HEADER.pack(MAGIC, VERSION, size, len(fleet), max_misses, len(patterns), samples)]
+    parts.append(struct.pack(f"<{len(fleet)}H", *fleet))
+    for key, count in zip(patterns, support):
+        cells = list(key) + [NO_CELL] * (max_misses - len(key))
+        parts.append(record.pack(*cells, min(int(count), 0xFFFFFFFF)))
+    head = b"".join(parts)
+    head += bytes(_align(len(head)) - len(head))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(head)
+        f.write(probs.astype("<f4").tobytes())
+    os.replace(tmp, path)
+
+
+_loaded = {}
+
+
+def load_priors(size=GRID_SIZE, fleet=None, build_missing=False, directory=HEATMAP_DIR):
+    # Per-process cache of opened files. A missing file gives None (callers
+    # fall back to plain counts) and is looked for again next time; build it
+    # with `python -m game.heatmap`, or pass build_missing in offline tools.
+    fleet = list(fleet) if fleet else default_fleet(size)
+    if size > BITBOARD_LIMIT:
+        return None
+    key = (size, tuple(sorted(fleet)), directory)
+    cache = _loaded.get(key)
+    if cache is not None:
+        return cache
+    path = heatmap_path(size, fleet, directory)
+    try:
+        cache = HeatmapCache(path)
+    except (OSError, ValueError, HeatmapError):
+        if not build_missing:
+            return None
+        max_misses = default_max_misses(size)
+        write(path, size, fleet, max_misses, SAMPLES, *build(size, fleet, max_misses))
+        cache = HeatmapCache(path)
+    _loaded[key] = cache
+    return cache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the opening heatmap prior cache")
+    parser.add_argument("--size", type=int, default=GRID_SIZE)
+    parser.add_argument("--fleet", type=parse_fleet, default=None)
+    parser.add_argument("--max-misses", type=int, default=None, help="longest cached opening (all misses)")
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=HEATMAP_DIR)
+    args = parser.parse_args(argv)
+
+    fleet = args.fleet or default_fleet(args.size)
+    max_misses = default_max_misses(args.size) if args.max_misses is None else args.max_misses
+    started = time.perf_counter()
+    try:
+        result = build(args.size, fleet, max_misses, args.samples, args.seed)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    path = heatmap_path(args.size, fleet, args.dir)
+    write(path, args.size, fleet, max_misses, args.samples, *result)
+    elapsed = time.perf_counter() - started
+    print(f"{path}: {len(result[0])} patterns, {os.path.getsize(path)} bytes, {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
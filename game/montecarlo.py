@@ -0,0 +1,131 @@
+﻿import atexit
+import multiprocessing
+import os
+import random
+from math import factorial
+
+from .board import iter_bits, placement_table
+
+SAMPLES_PER_WORKER = 200
+_pool = None
+_pool_workers = 0
+
+
+def _shared_pool(workers):
+    # One pool per process, shared by every Monte Carlo player in it.
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.terminate()
+        _pool = multiprocessing.Pool(workers)
+        _pool_workers = workers
+    return _pool
+
+
+@atexit.register
+def _close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool = None
+
+
+def sample_counts(args):
+    # Importance sampling of full fleet placements consistent with the shots:
+    # every unsunk hit covered, no ship on a miss or a sunk ship, no two ships
+    # touching. Each sample is built step by step (see _sample_one) and
+    # weighted by 1 / (probability of building it), divided by the number of
+    # build orders that give the same fleet, so the weighted counts estimate
+    # the uniform distribution over consistent fleets rather than one skewed
+    # toward cells next to hits. Returns per-cell weighted ship counts and
+    # the number of successful samples.
+    n, forbidden, hits, remaining, samples, seed = args
+    rng = random.Random(seed)
+    sizes = sorted(remaining, reverse=True)
+    allowed = {}
+    for size in set(sizes):
+        allowed[size] = [(mask, halo) for _, mask, halo in placement_table(size, n) if not mask & forbidden]
+    # Placements through each hit cell, used to cover hits first.
+    cover = {}
+    for idx in iter_bits(hits):
+        bit = 1 << idx
+        cover[idx] = [(size, p) for size in allowed for p in allowed[size] if p[0] & bit]
+
+    counts = [0.0] * (n * n)
+    done = 0
+    for _ in range(samples * 20):
+        if done >= samples:
+            break
+        sampled = _sample_one(rng, sizes, allowed, cover, hits)
+        if sampled is None:
+            continue
+        ships, weight = sampled
+        done += 1
+        for idx in iter_bits(ships & ~hits):
+            counts[idx] += weight
+    return counts, done
+
+
+def _sample_one(rng, sizes, allowed, cover, hits):
+    # Returns (ship mask, importance weight) or None on a dead end. The weight
+    # is the product of the number of choices at each step: the placements
+    # through the lowest uncovered hit, then every free placement of each
+    # remaining ship in a fixed size order. That order is the only freedom
+    # left: the hit phase is fixed by the fleet, and identical ships in the
+    # fill phase can come in any of k! orders.
+    left = list(sizes)
+    ships = 0
+    blocked = 0
+    weight = 1.0
+    uncovered = hits
+    while uncovered:
+        idx = (uncovered & -uncovered).bit_length() - 1
+        options = [(size, p) for size, p in cover[idx] if size in left and not p[0] & blocked]
+        if not options:
+            return None
+        weight *= len(options)
+        size, (mask, halo) = rng.choice(options)
+        left.remove(size)
+        ships |= mask
+        blocked |= halo
+        uncovered &= ~mask
+    # Every hit is covered now; the rest may not land on one.
+    blocked |= hits
+    for size in left:
+        options = [p for p in allowed[size] if not p[0] & blocked]
+        if not options:
+            return None
+        weight *= len(options)
+        mask, halo = rng.choice(options)
+        ships |= mask
+        blocked |= halo
+    for size in set(left):
+        weight /= factorial(left.count(size))
+    return ships, weight
+
+
+class MonteCarloSampler:
+    # Spreads sampling over a process pool, one RNG stream per task, so the
+    # number of samples per round grows linearly with the worker count.
+    def __init__(self, workers=None, samples_per_worker=SAMPLES_PER_WORKER):
+        if workers is None:
+            # Pool workers are daemonic and cannot start their own pool.
+            workers = 1 if multiprocessing.current_process().daemon else os.cpu_count() or 1
+        self.workers = workers
+        self.samples_per_worker = samples_per_worker
+
+    def counts(self, n, forbidden, hits, remaining):
+        # Drawn from the shared RNG so seeded games and simulations repeat.
+        seed = random.getrandbits(64)
+        jobs = [(n, forbidden, hits, remaining, self.samples_per_worker, seed + i) for i in range(self.workers)]
+        if self.workers == 1:
+            results = map(sample_counts, jobs)
+        else:
+            results = _shared_pool(self.workers).map(sample_counts, jobs)
+        total = [0.0] * (n * n)
+        done = 0
+        for counts, ok in results:
+            done += ok
+            for i, c in enumerate(counts):
+                total[i] += c
+        return total, done
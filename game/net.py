@@ -0,0 +1,413 @@
+﻿import argparse
+import asyncio
+import queue
+import random
+import socket
+import sys
+import threading
+import time
+
+from .ai import AIPlayer, STRATEGIES
+from .board import Board, random_fleet
+from .config import GRID_SIZE, default_fleet, parse_fleet
+from .replay import ship_record
+
+# Line protocol, one space-separated command per "\n"-terminated UTF-8 line.
+#
+# client -> server
+#   NEW ai [strategy]     play the server AI; the match starts at once
+#   NEW human             open a match for a second client, answered with MATCH
+#   JOIN <id>             take the second seat of an open match
+#   FIRE <x> <y>          shoot at the opponent
+#   BYE
+#
+# server -> client
+#   MATCH <id>
+#   START <size> <you|them> <fleet sizes, comma separated>   who shoots first
+#   FLEET <x,y,size,horizontal> ...                          your own ships
+#   TURN                                                     your move
+#   SHOT <you|them> <x> <y> <result> [<x,y> ...]             sunk ship cells follow "sunk"
+#   OVER <win|lose|abandoned>
+#   ERR <text>
+LINE_LIMIT = 1 << 20
+DEFAULT_PORT = 8765
+
+
+class Match:
+    # Kept small: an open match is an id and one writer; boards are only
+    # created when the second seat is filled.
+    __slots__ = ("id", "seats", "boards", "ai", "turn")
+
+    def __init__(self, match_id, writer):
+        self.id = match_id
+        self.seats = [writer, None]
+        self.boards = None
+        self.ai = None
+        self.turn = None
+
+
+def _line(*parts):
+    return (" ".join(str(p) for p in parts) + "\n").encode()
+
+
+def _cells(cells):
+    return " ".join(f"{x},{y}" for x, y in cells)
+
+
+class MatchServer:
+    # Hosts any number of matches; Board is the only authority on results.
+    def __init__(self, size=GRID_SIZE, fleet=None, strategy="hunt", rng=None):
+        self.size = size
+        self.fleet = list(fleet) if fleet else default_fleet(size)
+        self.strategy = strategy
+        self.rng = rng or random.Random()
+        self.matches = {}
+        self.next_id = 1
+        self.finished = 0
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        match = None
+        seat = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode("utf-8", "replace").split()
+                if not parts:
+                    continue
+                cmd = parts[0]
+                if cmd == "BYE":
+                    break
+                if cmd == "NEW" and match is None:
+                    match, seat = await self.new_match(writer, parts[1:])
+                elif cmd == "JOIN" and match is None and len(parts) == 2 and parts[1].isdigit():
+                    match, seat = await self.join_match(writer, int(parts[1]))
+                elif cmd == "FIRE" and match is not None and len(parts) == 3:
+                    await self.fire(match, seat, parts[1], parts[2])
+                else:
+                    writer.write(_line("ERR", "unexpected", cmd))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            if match is not None:
+                self.leave(match, seat)
+            writer.close()
+
+    async def new_match(self, writer, args):
+        match = Match(self.next_id, writer)
+        self.next_id += 1
+        mode = args[0] if args else "ai"
+        if mode == "ai":
+            strategy = args[1] if len(args) > 1 else self.strategy
+            if strategy not in STRATEGIES:
+                writer.write(_line("ERR", "unknown strategy", strategy))
+                return None, None
+            match.ai = AIPlayer(strategy, self.size, self.fleet)
+            self.matches[match.id] = match
+            writer.write(_line("MATCH", match.id))
+            await self.start_match(match)
+        elif mode == "human":
+            self.matches[match.id] = match
+            writer.write(_line("MATCH", match.id))
+        else:
+            writer.write(_line("ERR", "unknown mode", mode))
+            return None, None
+        return match, 0
+
+    async def join_match(self, writer, match_id):
+        match = self.matches.get(match_id)
+        if match is None or match.ai is not None or match.seats[1] is not None:
+            writer.write(_line("ERR", "no open match", match_id))
+            return None, None
+        match.seats[1] = writer
+        writer.write(_line("MATCH", match.id))
+        await self.start_match(match)
+        return match, 1
+
+    async def start_match(self, match):
+        match.boards = [Board(self.size, self.fleet), Board(self.size, self.fleet)]
+        for board in match.boards:
+            board.place_fleet(random_fleet(self.fleet, self.rng, self.size))
+        match.turn = self.rng.randrange(2)
+        fleet = ",".join(str(s) for s in self.fleet)
+        for seat, writer in enumerate(match.seats):
+            if writer is None:
+                continue
+            writer.write(_line("START", self.size, "you" if match.turn == seat else "them", fleet))
+            ships = " ".join(",".join(str(v) for v in ship_record(ship)) for ship in match.boards[seat].ships)
+            writer.write(_line("FLEET", ships))
+        await self.next_turn(match)
+
+    async def fire(self, match, seat, x, y):
+        writer = match.seats[seat]
+        if match.turn != seat:
+            writer.write(_line("ERR", "not your turn"))
+            return
+        try:
+            x, y = int(x), int(y)
+        except ValueError:
+            writer.write(_line("ERR", "bad cell"))
+            return
+        if not match.boards[1 - seat].in_bounds(x, y):
+            writer.write(_line("ERR", "out of bounds"))
+            return
+        self.shoot(match, seat, x, y)
+        await self.next_turn(match)
+
+    def shoot(self, match, seat, x, y):
+        board = match.boards[1 - seat]
+        result = board.shoot(x, y)
+        tail = ""
+        if result == "sunk":
+            tail = _cells(board.ships[board.grid[y][x]].cells)
+        for other, writer in enumerate(match.seats):
+            if writer is not None:
+                writer.write(_line("SHOT", "you" if other == seat else "them", x, y, result, tail))
+
+        if result == "sunk" and board.all_sunk():
+            self.end_match(match, winner=seat)
+        elif result == "miss":
+            match.turn = 1 - seat
+        return result
+
+    async def next_turn(self, match):
+        # The server AI answers at once; clients pace the display themselves.
+        # Its moves run in the default executor so a slow strategy does not
+        # stall the other connections.
+        loop = asyncio.get_running_loop()
+        while match.turn == 1 and match.ai is not None:
+            shot = await loop.run_in_executor(None, match.ai.choose_shot, match.boards[0])
+            if match.id not in self.matches or match.turn != 1:
+                # The human left (or the match ended) while the AI was thinking.
+                return
+            if shot is None:
+                match.turn = 0
+                break
+            result = self.shoot(match, 1, *shot)
+            if result in ["hit", "sunk"]:
+                match.ai.process_result(shot, result, match.boards[0])
+        if match.turn is not None:
+            writer = match.seats[match.turn]
+            if writer is not None:
+                writer.write(_line("TURN"))
+
+    def end_match(self, match, winner):
+        for seat, writer in enumerate(match.seats):
+            if writer is not None:
+                writer.write(_line("OVER", "win" if seat == winner else "lose"))
+        match.turn = None
+        self.matches.pop(match.id, None)
+        self.finished += 1
+
+    def leave(self, match, seat):
+        match.seats[seat] = None
+        if self.matches.pop(match.id, None) is None:
+            return
+        match.turn = None
+        for writer in match.seats:
+            if writer is not None:
+                writer.write(_line("OVER", "abandoned"))
+
+
+def parse_records(tokens):
+    # "x,y" cells or "x,y,size,horizontal" ships.
+    return [tuple(int(v) for v in token.split(",")) for token in tokens]
+
+
+async def play_bot(host, port, strategy="hunt", mode="ai", join=None, on_match=None):
+    # A client-side AI over the wire: mode "ai" plays the server AI, "human"
+    # opens a match (its id goes to on_match), `join` takes an open one.
+    reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+    if join is not None:
+        writer.write(_line("JOIN", join))
+    elif mode == "ai":
+        writer.write(_line("NEW", "ai", strategy))
+    else:
+        writer.write(_line("NEW", "human"))
+
+    ai = None
+    mirror = None
+    shots = 0
+    outcome = "closed"
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            parts = line.decode().split()
+            cmd = parts[0]
+            if cmd == "MATCH" and on_match is not None:
+                on_match(int(parts[1]))
+            elif cmd == "START":
+                size, fleet = int(parts[1]), parse_fleet(parts[3])
+                ai = AIPlayer(strategy, size, fleet)
+                mirror = Board(size, fleet)
+            elif cmd == "TURN":
+                shot = ai.choose_shot(mirror)
+                if shot is None:
+                    # Nothing left to shoot at: our mirror disagrees with the
+                    # server's board. Leave with BYE rather than send garbage.
+                    outcome = "error: no legal shot"
+                    break
+                writer.write(_line("FIRE", *shot))
+                shots += 1
+            elif cmd == "SHOT" and parts[1] == "you":
+                x, y, result = int(parts[2]), int(parts[3]), parts[4]
+                mirror.apply_result(x, y, result, parse_records(parts[5:]))
+                if result in ["hit", "sunk"]:
+                    ai.process_result((x, y), result, mirror)
+            elif cmd == "OVER":
+                outcome = parts[1]
+                break
+            elif cmd == "ERR":
+                outcome = "error: " + " ".join(parts[1:])
+                break
+        writer.write(_line("BYE"))
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+    return outcome, shots
+
+
+async def loopback(matches=100, vs_ai=False, strategy="hunt", size=GRID_SIZE, fleet=None):
+    # Starts a server on an ephemeral localhost port and plays `matches`
+    # bot-vs-bot (or bot-vs-server-AI) games through it concurrently.
+    server = MatchServer(size, fleet, strategy)
+    port = await server.start("127.0.0.1", 0)
+
+    async def pair():
+        opened = asyncio.get_running_loop().create_future()
+        host = asyncio.create_task(play_bot("127.0.0.1", port, strategy, "human", on_match=opened.set_result))
+        guest = asyncio.create_task(play_bot("127.0.0.1", port, strategy, join=await opened))
+        return await host, await guest
+
+    started = time.perf_counter()
+    if vs_ai:
+        results = await asyncio.gather(*[play_bot("127.0.0.1", port, strategy) for _ in range(matches)])
+    else:
+        results = [r for both in await asyncio.gather(*[pair() for _ in range(matches)]) for r in both]
+    elapsed = time.perf_counter() - started
+    await server.close()
+    return results, elapsed
+
+
+class NetClient:
+    # Blocking socket for the pygame client: a reader thread queues parsed
+    # lines and calls `notify` so an idle event loop wakes up.
+    def __init__(self, host, port, notify=None):
+        self.sock = socket.create_connection((host, port))
+        self.inbox = queue.Queue()
+        self.notify = notify
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        try:
+            with self.sock.makefile("r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if parts:
+                        self.inbox.put(parts)
+                        if self.notify:
+                            self.notify()
+        except (OSError, ValueError):
+            pass
+        self.inbox.put(["CLOSED"])
+        if self.notify:
+            self.notify()
+
+    def send(self, *parts):
+        try:
+            self.sock.sendall(_line(*parts))
+        except OSError:
+            self.inbox.put(["CLOSED"])
+
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.inbox.get_nowait())
+            except queue.Empty:
+                return out
+
+    def close(self):
+        try:
+            self.sock.sendall(_line("BYE"))
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port or DEFAULT_PORT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sea battle match server")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="host matches over TCP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--strategy", choices=STRATEGIES, default="hunt", help="server AI strategy")
+    serve.add_argument("--size", type=int, default=GRID_SIZE)
+    serve.add_argument("--fleet", type=parse_fleet, default=None)
+
+    bot = sub.add_parser("bot", help="play one match as a client-side AI")
+    bot.add_argument("address", nargs="?", default=f"127.0.0.1:{DEFAULT_PORT}")
+    bot.add_argument("--strategy", choices=STRATEGIES, default="hunt")
+    bot.add_argument("--join", type=int, default=None)
+    bot.add_argument("--vs", choices=["ai", "human"], default="ai")
+
+    loop = sub.add_parser("loopback", help="play matches through a localhost server")
+    loop.add_argument("--matches", type=int, default=200)
+    loop.add_argument("--vs-ai", action="store_true")
+    loop.add_argument("--strategy", choices=STRATEGIES, default="hunt")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        async def serve_forever():
+            server = MatchServer(args.size, args.fleet, args.strategy)
+            port = await server.start(args.host, args.port)
+            print(f"listening on {args.host}:{port}", file=sys.stderr)
+            async with server.server:
+                await server.server.serve_forever()
+
+        try:
+            asyncio.run(serve_forever())
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "bot":
+        host, port = parse_address(args.address)
+
+        def announce(match_id):
+            print(f"match {match_id}", file=sys.stderr)
+
+        outcome, shots = asyncio.run(play_bot(host, port, args.strategy, args.vs, args.join, announce))
+        print(f"{outcome} shots={shots}")
+    else:
+        results, elapsed = asyncio.run(loopback(args.matches, args.vs_ai, args.strategy))
+        outcomes = {}
+        for outcome, _ in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        print(f"matches={args.matches} seconds={elapsed:.2f} outcomes={outcomes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+﻿import time
+from collections import deque
+
+PHASES = ["wait", "events", "update", "draw", "flip"]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[i]
+
+
+class FrameProfiler:
+    # Splits each pass of the main loop into phases and keeps a rolling
+    # window of per-frame timings. Optionally appends every frame to a CSV
+    # trace for offline analysis.
+    def __init__(self, window=300, trace_path=None):
+        self.frames = deque(maxlen=window)
+        self.frame = None
+        self.frame_no = 0
+        self.mark_at = 0.0
+        self.started = time.perf_counter()
+        self.trace = None
+        if trace_path:
+            self.trace = open(trace_path, "w", encoding="utf-8", buffering=1 << 16)
+            self.trace.write("frame,t,state," + ",".join(PHASES) + ",work\n")
+
+    def begin(self):
+        self.frame = dict.fromkeys(PHASES, 0.0)
+        self.mark_at = time.perf_counter()
+        self.frame["start"] = self.mark_at
+
+    def mark(self, phase):
+        # Charges the time since the previous mark to `phase`.
+        now = time.perf_counter()
+        self.frame[phase] += now - self.mark_at
+        self.mark_at = now
+
+    def end(self, state):
+        frame = self.frame
+        frame["state"] = state
+        frame["work"] = sum(frame[p] for p in PHASES if p != "wait")
+        self.frames.append(frame)
+        self.frame_no += 1
+        if self.trace is not None:
+            times = ",".join(f"{frame[p] * 1000:.3f}" for p in PHASES)
+            self.trace.write(
+                f"{self.frame_no},{frame['start'] - self.started:.4f},{state},{times},{frame['work'] * 1000:.3f}\n"
+            )
+
+    def summary(self, state=None):
+        # Milliseconds over the window; phase averages use only frames drawn in
+        # `state` when given, so per-state draw cost is not diluted.
+        frames = list(self.frames)
+        if not frames:
+            return None
+        span = frames[-1]["start"] - frames[0]["start"]
+        work = sorted(f["work"] for f in frames)
+        scoped = [f for f in frames if f["state"] == state] if state else frames
+        scoped = scoped or frames
+        return {
+            "fps": (len(frames) - 1) / span if span > 0 else 0.0,
+            "p50": percentile(work, 0.50) * 1000,
+            "p99": percentile(work, 0.99) * 1000,
+            "max": work[-1] * 1000,
+            "phases": {p: sum(f[p] for f in scoped) / len(scoped) * 1000 for p in PHASES},
+        }
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
@@ -0,0 +1,120 @@
+﻿import pygame
+
+from .ui import CELL_SIZE, BOARD_SIZE, MIN_CELL_SIZE, LIGHT_GRAY, DARK, SHIP_GREEN, BLUE, RED
+
+
+class BoardRenderer:
+    # Keeps a pre-rendered board surface and repaints only cells whose shot
+    # state changed since the previous frame, plus the animated cell. Boards
+    # larger than the widget are shown through a scrollable, zoomable viewport
+    # and only the visible cells are ever drawn.
+    def __init__(self, show_ships):
+        self.show_ships = show_ships
+        self.surface = pygame.Surface((BOARD_SIZE, BOARD_SIZE))
+        self.board = None
+        self.ships = None
+        self.log_pos = 0
+        self.anim_cell = None
+        self.repainted = False
+
+        self.cell_size = CELL_SIZE
+        self.view_x = 0
+        self.view_y = 0
+        self.view_dirty = True
+
+    def min_cell_size(self, board):
+        return min(CELL_SIZE, max(MIN_CELL_SIZE, BOARD_SIZE // board.size))
+
+    def visible_cells(self):
+        return -(-BOARD_SIZE // self.cell_size)
+
+    def clamp_view(self):
+        span = max(0, self.board.size - BOARD_SIZE // self.cell_size)
+        self.view_x = max(0, min(self.view_x, span))
+        self.view_y = max(0, min(self.view_y, span))
+
+    def zoom(self, steps, local_pos):
+        if self.board is None:
+            return
+        focus = self.cell_at(local_pos)
+        size = self.cell_size + steps * max(1, self.cell_size // 4)
+        size = max(self.min_cell_size(self.board), min(CELL_SIZE, size))
+        if size == self.cell_size:
+            return
+        self.cell_size = size
+        if focus is not None:
+            # Keep the cell under the cursor in place.
+            self.view_x = focus[0] - local_pos[0] // size
+            self.view_y = focus[1] - local_pos[1] // size
+        self.clamp_view()
+        self.view_dirty = True
+
+    def pan(self, dx_cells, dy_cells):
+        if self.board is None or (dx_cells == 0 and dy_cells == 0):
+            return
+        old = (self.view_x, self.view_y)
+        self.view_x += dx_cells
+        self.view_y += dy_cells
+        self.clamp_view()
+        if (self.view_x, self.view_y) != old:
+            self.view_dirty = True
+
+    def cell_at(self, local_pos):
+        x = self.view_x + local_pos[0] // self.cell_size
+        y = self.view_y + local_pos[1] // self.cell_size
+        if self.board is None or not self.board.in_bounds(x, y):
+            return None
+        return x, y
+
+    def cell_rect(self, x, y):
+        size = self.cell_size
+        return pygame.Rect((x - self.view_x) * size, (y - self.view_y) * size, size, size)
+
+    def is_visible(self, x, y):
+        span = self.visible_cells()
+        return self.view_x <= x < self.view_x + span and self.view_y <= y < self.view_y + span
+
+    def dirty_cells(self, board, anim_cell=None):
+        if board is not self.board or board.ships is not self.ships:
+            self.board = board
+            self.ships = board.ships
+            self.cell_size = max(self.min_cell_size(board), min(self.cell_size, CELL_SIZE))
+            self.clamp_view()
+            self.view_dirty = True
+
+        self.repainted = self.view_dirty
+        if self.view_dirty:
+            self.view_dirty = False
+            self.surface.fill(LIGHT_GRAY)
+            span = self.visible_cells()
+            x1 = min(board.size, self.view_x + span)
+            y1 = min(board.size, self.view_y + span)
+            cells = [(x, y) for y in range(self.view_y, y1) for x in range(self.view_x, x1)]
+        else:
+            n = board.size
+            cells = []
+            for idx in board.shot_log[self.log_pos :]:
+                x, y = idx % n, idx // n
+                if self.is_visible(x, y):
+                    cells.append((x, y))
+            for cell in (self.anim_cell, anim_cell):
+                if cell is not None and cell not in cells and self.is_visible(*cell):
+                    cells.append(cell)
+        self.log_pos = len(board.shot_log)
+        self.anim_cell = anim_cell
+        return cells
+
+    def draw_cell(self, board, x, y, hide_hit=False):
+        rect = self.cell_rect(x, y)
+        pygame.draw.rect(self.surface, LIGHT_GRAY, rect)
+        if self.cell_size >= 6:
+            pygame.draw.rect(self.surface, DARK, rect, 1)
+
+        if self.show_ships and board.grid[y][x] != -1:
+            pygame.draw.rect(self.surface, SHIP_GREEN, rect)
+
+        if board.shots[y][x] == 1:
+            pygame.draw.circle(self.surface, BLUE, rect.center, max(1, self.cell_size * 4 // CELL_SIZE))
+        elif board.shots[y][x] == 2 and not hide_hit:
+            pygame.draw.rect(self.surface, RED, rect)
+        return rect
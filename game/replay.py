@@ -0,0 +1,293 @@
+﻿import argparse
+import struct
+import sys
+import time
+from array import array
+
+from .board import Board, placement
+from .config import BITBOARD_LIMIT, MAX_GRID_SIZE
+
+# File layout (little-endian):
+#   header  magic, version, grid size, ships per board, RNG seed
+#   ships   two boards (human, then AI) x ships per board: x, y, size, horizontal
+#   shots   fixed 8-byte records until EOF: cell << 3 | shooter << 2 | result, ms since start
+MAGIC = b"SBRP"
+VERSION = 1
+HEADER = struct.Struct("<4sBHHQ")
+SHIP = struct.Struct("<HHHB")
+SHOT = struct.Struct("<II")
+
+RESULTS = ["miss", "hit", "sunk", "repeat"]
+RESULT_CODES = {name: code for code, name in enumerate(RESULTS)}
+
+# Shooter 0 is the human firing at the AI board, 1 is the AI firing back.
+HUMAN = 0
+AI = 1
+
+
+class ReplayError(Exception):
+    pass
+
+
+def ship_record(ship):
+    x, y = min(ship.cells)
+    horizontal = len(ship.cells) == 1 or ship.cells[0][1] == ship.cells[1][1]
+    return x, y, len(ship.cells), int(horizontal)
+
+
+class GameRecorder:
+    # Streams one game to disk: the header when the game starts, then one
+    # record per shot, flushed so a crash still leaves a usable log. Shot
+    # times are read from `clock`, the game's own, so games run on a
+    # virtual clock record their simulated timing.
+    def __init__(self, path, size, seed, boards, clock=time.monotonic):
+        self.path = path
+        self.file = open(path, "wb")
+        ships = [ship_record(ship) for ship in boards[0].ships]
+        self.file.write(HEADER.pack(MAGIC, VERSION, size, len(ships), seed))
+        for board in boards:
+            for ship in board.ships:
+                self.file.write(SHIP.pack(*ship_record(ship)))
+        self.file.flush()
+        self.size = size
+        self.clock = clock
+        self.started = clock()
+
+    def shot(self, shooter, x, y, result):
+        ms = int((self.clock() - self.started) * 1000)
+        word = (y * self.size + x) << 3 | shooter << 2 | RESULT_CODES[result]
+        self.file.write(SHOT.pack(word, ms))
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class GameLog:
+    def __init__(self, size, seed, fleets, shots):
+        self.size = size
+        self.seed = seed
+        # Per board: list of (x, y, size, horizontal).
+        self.fleets = fleets
+        # Flat array('I'): word, ms, word, ms, ...
+        self.shots = shots
+        self._ship_map = None
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < HEADER.size:
+            raise ReplayError("truncated header")
+        magic, version, size, count, seed = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ReplayError("not a game record")
+        if not 1 <= size <= MAX_GRID_SIZE:
+            raise ReplayError(f"bad board size {size}")
+        if not count:
+            raise ReplayError("empty fleet")
+        pos = HEADER.size
+        fleets = []
+        for _ in range(2):
+            ships = []
+            for _ in range(count):
+                if pos + SHIP.size > len(data):
+                    raise ReplayError("truncated fleet")
+                x, y, length, horizontal = ship = SHIP.unpack_from(data, pos)
+                end_x, end_y = (x + length - 1, y) if horizontal else (x, y + length - 1)
+                if not length or horizontal > 1 or end_x >= size or end_y >= size:
+                    raise ReplayError(f"ship {ship} off the {size}x{size} board")
+                ships.append(ship)
+                pos += SHIP.size
+            fleets.append(ships)
+        if sorted(ship[2] for ship in fleets[0]) != sorted(ship[2] for ship in fleets[1]):
+            raise ReplayError("the two fleets differ")
+        # A crash mid-write can leave a partial last record: drop it.
+        end = pos + (len(data) - pos) // SHOT.size * SHOT.size
+        shots = array("I")
+        shots.frombytes(data[pos:end])
+        if sys.byteorder != "little":
+            shots.byteswap()
+        if shots and max(shots[0::2]) >> 3 >= size * size:
+            raise ReplayError("shot off the board")
+        return cls(size, seed, fleets, shots)
+
+    @property
+    def fleet(self):
+        return [ship[2] for ship in self.fleets[0]]
+
+    def __len__(self):
+        return len(self.shots) // 2
+
+    def duration(self):
+        return self.shots[-1] if self.shots else 0
+
+    def shot(self, i):
+        word, ms = self.shots[2 * i], self.shots[2 * i + 1]
+        cell = word >> 3
+        return (word >> 2) & 1, cell % self.size, cell // self.size, RESULTS[word & 3], ms
+
+    def ship_map(self):
+        # Per board, cell index -> ship number and each ship's cells; built
+        # once per log, so repeated replays only pay for the shots.
+        if self._ship_map is None:
+            n = self.size
+            owners = []
+            ships = []
+            for fleet in self.fleets:
+                owner = {}
+                cells = []
+                for i, (x, y, size, horizontal) in enumerate(fleet):
+                    ship = placement_cells(x, y, size, horizontal)
+                    for cx, cy in ship:
+                        owner[cy * n + cx] = i
+                    cells.append(ship)
+                owners.append(owner)
+                ships.append(cells)
+            self._ship_map = owners, ships
+        return self._ship_map
+
+    def boards(self):
+        # [human board, AI board] with the recorded fleets placed.
+        out = []
+        for ships in self.fleets:
+            board = Board(self.size, self.fleet)
+            board.place_fleet(fleet_placements(ships, self.size))
+            out.append(board)
+        return out
+
+
+def placement_cells(x, y, size, horizontal):
+    if horizontal:
+        return [(x + i, y) for i in range(size)]
+    return [(x, y + i) for i in range(size)]
+
+
+def fleet_placements(ships, grid_size):
+    # (x, y, size, horizontal) records -> Board.place_fleet entries.
+    if grid_size <= BITBOARD_LIMIT:
+        return [placement(x, y, s, bool(h), grid_size) for x, y, s, h in ships]
+    return [(placement_cells(x, y, s, h), None, None) for x, y, s, h in ships]
+
+
+def replay(log, verify=True):
+    # Re-executes every shot against fresh boards; returns [human, AI] boards.
+    boards = log.boards()
+    n = log.size
+    # A shot by shooter s lands on board 1 - s.
+    targets = (boards[1].shoot, boards[0].shoot)
+    words = log.shots[0::2]
+    if not verify:
+        for word in words:
+            cell = word >> 3
+            targets[(word >> 2) & 1](cell % n, cell // n)
+        return boards
+    for i, word in enumerate(words):
+        cell = word >> 3
+        result = targets[(word >> 2) & 1](cell % n, cell // n)
+        if result != RESULTS[word & 3]:
+            raise ReplayError(f"shot {i}: recorded {RESULTS[word & 3]}, replayed {result}")
+    return boards
+
+
+def replay_outcome(log, verify=True):
+    # Headless fast path for the CLI: the same rules as Board.shoot on a flat
+    # cell -> ship map and one set of shot cells per board, with no Board or
+    # Ship objects. Returns [human fleet sunk, AI fleet sunk].
+    n = log.size
+    owners, ships = log.ship_map()
+    left = [[len(cells) for cells in fleet] for fleet in ships]
+    afloat = [len(fleet) for fleet in ships]
+    shot = [set(), set()]
+    for i, word in enumerate(log.shots[0::2]):
+        target = 1 - ((word >> 2) & 1)
+        cell = word >> 3
+        done = shot[target]
+        if cell in done:
+            result = 3
+        else:
+            done.add(cell)
+            ship = owners[target].get(cell)
+            if ship is None:
+                result = 0
+            else:
+                left[target][ship] -= 1
+                if left[target][ship]:
+                    result = 1
+                else:
+                    # Sunk: its halo counts as shot, as in Board._mark_around_sunk.
+                    for cx, cy in ships[target][ship]:
+                        for ny in range(max(0, cy - 1), min(n, cy + 2)):
+                            done.update(range(ny * n + max(0, cx - 1), ny * n + min(n, cx + 2)))
+                    afloat[target] -= 1
+                    result = 2
+        if verify and result != word & 3:
+            raise ReplayError(f"shot {i}: recorded {RESULTS[word & 3]}, replayed {RESULTS[result]}")
+    return [not afloat[0], not afloat[1]]
+
+
+class ReplayCursor:
+    # Steps a log forward against live boards by recorded time, for the GUI.
+    def __init__(self, log, boards):
+        self.log = log
+        self.boards = boards
+        self.pos = 0
+        self.clock = 0.0
+
+    def done(self):
+        return self.pos >= len(self.log)
+
+    def advance(self, ms):
+        # Applies every shot recorded up to `ms`; returns the last one or None.
+        self.clock = ms
+        last = None
+        while self.pos < len(self.log):
+            shooter, x, y, result, at = self.log.shot(self.pos)
+            if at > ms:
+                break
+            self.boards[1 - shooter].shoot(x, y)
+            self.pos += 1
+            last = shooter, x, y, result
+        if self.done():
+            self.clock = min(ms, self.log.duration())
+        return last
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-execute recorded games headless")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--no-verify", action="store_true", help="skip comparing results with the log")
+    parser.add_argument("--repeat", type=int, default=1, help="replay each log this many times (throughput)")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.paths:
+        try:
+            log = GameLog.load(path)
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                sunk = replay_outcome(log, verify=not args.no_verify)
+            elapsed = time.perf_counter() - started
+        except (OSError, ReplayError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            failed = True
+            continue
+        shots = len(log) * args.repeat
+        rate = shots / elapsed if elapsed > 0 else 0.0
+        if sunk[1]:
+            winner = "human"
+        elif sunk[0]:
+            winner = "ai"
+        else:
+            winner = "unfinished"
+        print(f"{path}: size={log.size} seed={log.seed} shots={len(log)} winner={winner} shots/s={rate:.0f}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
 ﻿import json
 import os
+import sqlite3
+import time
 
 
 class ScoreManager:
-    def __init__(self, path):
+    def __init__(self, path, top_limit=10):
         self.path = path
+        self.legacy_path = os.path.splitext(path)[0] + ".json"
+        self.top_limit = top_limit
         self.records = []
+        self.total = 0
+        self.conn = None
+        # Pages and total are cached per process. PRAGMA data_version changes
+        # when another connection commits (shared installs), which drops them;
+        # this process's own writes drop them directly.
+        self._pages = {}
+        self._data_version = None
         self.load()
 
     @staticmethod
@@ -23,11 +34,27 @@ class ScoreManager:
                 return int(parts[0]) * 60 + int(parts[1])
         return None
 
-    def load(self):
+    def _connect(self):
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error:
+            # Unwritable location: keep this session's records in memory.
+            conn = sqlite3.connect(":memory:")
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "id INTEGER PRIMARY KEY, name TEXT NOT NULL, seconds INTEGER NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS records_seconds ON records (seconds, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS records_name ON records (name, seconds)")
+        return conn
+
+    def _read_legacy(self):
         raw = []
-        if os.path.exists(self.path):
+        if os.path.exists(self.legacy_path):
             try:
-                with open(self.path, "r", encoding="utf-8") as f:
+                with open(self.legacy_path, "r", encoding="utf-8") as f:
                     raw = json.load(f)
             except (json.JSONDecodeError, OSError):
                 raw = []
@@ -45,28 +72,111 @@ class ScoreManager:
                 seconds = self._parse_seconds(rec.get("time"))
             if seconds is None:
                 continue
+            normalized.append((name, max(0, int(seconds))))
+        return normalized
+
+    def load(self):
+        if self.conn is None:
+            self.conn = self._connect()
+        try:
+            self.total = self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            if not self.total:
+                legacy = self._read_legacy()
+                if legacy:
+                    now = time.time()
+                    with self.conn:
+                        self.conn.executemany(
+                            "INSERT INTO records (name, seconds, created) VALUES (?, ?, ?)",
+                            [(name, sec, now) for name, sec in legacy],
+                        )
+                    self.total = len(legacy)
+        except sqlite3.Error:
+            self.total = 0
+        self._pages = {}
+        self._data_version = self._read_data_version()
+        self.records = self.top(self.top_limit)
 
-            normalized.append(
-                {
-                    "name": name,
-                    "seconds": int(seconds),
-                    "time": self.format_time(seconds),
-                }
+    def _read_data_version(self):
+        try:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def _refresh(self):
+        # Reload the cached total and pages if another process wrote records.
+        version = self._read_data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+        self._pages = {}
+        try:
+            self.total = self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        except sqlite3.Error:
+            pass
+
+    def _rows(self, sql, params):
+        try:
+            rows = self.conn.execute(sql, params).fetchall()
+        except sqlite3.Error:
+            return []
+        return [{"name": name, "seconds": sec, "time": self.format_time(sec)} for name, sec in rows]
+
+    def top(self, limit, offset=0):
+        self._refresh()
+        key = (limit, offset)
+        page = self._pages.get(key)
+        if page is None:
+            page = self._rows(
+                "SELECT name, seconds FROM records ORDER BY seconds, id LIMIT ? OFFSET ?",
+                (limit, offset),
             )
+            if len(self._pages) >= 64:
+                self._pages.clear()
+            self._pages[key] = page
+        return page
+
+    def page(self, index, per_page):
+        return self.top(per_page, max(0, index) * per_page)
 
-        normalized.sort(key=lambda r: r["seconds"])
-        self.records = normalized[:10]
+    def count(self):
+        self._refresh()
+        return self.total
+
+    def best_for(self, name):
+        rows = self._rows(
+            "SELECT name, seconds FROM records WHERE name = ? ORDER BY seconds, id LIMIT 1",
+            (name,),
+        )
+        return rows[0] if rows else None
+
+    def player_bests(self, limit, offset=0):
+        return self._rows(
+            "SELECT name, MIN(seconds) AS best FROM records GROUP BY name ORDER BY best, name LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
 
     def add_record(self, name, seconds):
         sec = max(0, int(seconds))
-        self.records.append({"name": name, "seconds": sec, "time": self.format_time(sec)})
-        self.records.sort(key=lambda r: r["seconds"])
-        self.records = self.records[:10]
-        self.save()
+        try:
+            # One transaction per result: a crash leaves either the old or the new state.
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO records (name, seconds, created) VALUES (?, ?, ?)",
+                    (name, sec, time.time()),
+                )
+            self.total += 1
+        except sqlite3.Error:
+            return
+        self._pages = {}
+        self.records = self.top(self.top_limit)
 
     def save(self):
         try:
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump(self.records, f, ensure_ascii=False, indent=2)
-        except OSError:
+            self.conn.commit()
+        except sqlite3.Error:
             pass
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
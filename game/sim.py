@@ -0,0 +1,225 @@
+﻿import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from .ai import AIPlayer, STRATEGIES
+from .board import check_fleet
+from .config import GRID_SIZE, default_fleet, parse_fleet
+from .fleetpool import FleetPoolError, shared_pool
+
+
+class SimStats:
+    def __init__(self):
+        self.games = 0
+        self.first_wins = 0
+        self.shots_hist = {}
+
+    def add(self, first_won, shots):
+        self.games += 1
+        if first_won:
+            self.first_wins += 1
+        self.shots_hist[shots] = self.shots_hist.get(shots, 0) + 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.first_wins += other.first_wins
+        for shots, count in other.shots_hist.items():
+            self.shots_hist[shots] = self.shots_hist.get(shots, 0) + count
+
+    def first_win_rate(self):
+        return self.first_wins / self.games if self.games else 0.0
+
+    def mean_shots(self):
+        if not self.games:
+            return 0.0
+        return sum(s * c for s, c in self.shots_hist.items()) / self.games
+
+    def percentile(self, q):
+        if not self.games:
+            return 0
+        rank = max(1, int(round(q * self.games)))
+        seen = 0
+        for shots in sorted(self.shots_hist):
+            seen += self.shots_hist[shots]
+            if seen >= rank:
+                return shots
+        return max(self.shots_hist)
+
+    def to_dict(self):
+        return {
+            "games": self.games,
+            "first_wins": self.first_wins,
+            "first_win_rate": self.first_win_rate(),
+            "mean_shots": self.mean_shots(),
+            "p50_shots": self.percentile(0.5),
+            "p90_shots": self.percentile(0.9),
+            "shots_hist": {str(s): self.shots_hist[s] for s in sorted(self.shots_hist)},
+        }
+
+
+def play_game(first=0, strategy="hunt", size=GRID_SIZE, fleet=None, endgame=True, pool=None):
+    fleet = fleet or default_fleet(size)
+    players = [AIPlayer(strategy, size, fleet, endgame), AIPlayer(strategy, size, fleet, endgame)]
+    for player in players:
+        if pool is not None:
+            player.board.place_fleet(pool.take())
+        else:
+            player.board.place_ships_auto()
+    return play_players(players, first)
+
+
+def play_players(players, first=0):
+    # Plays two players with placed fleets to the end; returns (winner, shots).
+    shots = [0, 0]
+    turn = first
+    passes = 0
+    while True:
+        me = players[turn]
+        enemy = players[1 - turn]
+        shot = me.choose_shot(enemy.board)
+        if shot is None:
+            # Neither side can shoot: the fleets cannot be finished.
+            passes += 1
+            if passes >= 2:
+                raise RuntimeError("no legal shot for either player")
+            turn = 1 - turn
+            continue
+        passes = 0
+
+        result = enemy.board.shoot(*shot)
+        shots[turn] += 1
+        if result in ["hit", "sunk"]:
+            me.process_result(shot, result, enemy.board)
+            if enemy.board.all_sunk():
+                return turn, shots[turn]
+        elif result == "miss":
+            turn = 1 - turn
+
+
+def run_chunk(args):
+    seed, games, strategy, size, fleet, endgame, fleet_pool = args
+    random.seed(seed)
+    pool = shared_pool(fleet_pool) if fleet_pool else None
+    stats = SimStats()
+    for _ in range(games):
+        first = random.randint(0, 1)
+        winner, shots = play_game(first, strategy, size, fleet, endgame, pool)
+        stats.add(winner == first, shots)
+    return stats
+
+
+def run(
+    games,
+    workers=None,
+    chunk=500,
+    seed=0,
+    strategy="hunt",
+    size=GRID_SIZE,
+    fleet=None,
+    report=None,
+    endgame=True,
+    fleet_pool=None,
+):
+    # fleet_pool: path of a game.fleetpool file to draw placements from.
+    # One seed per chunk keeps results reproducible regardless of scheduling.
+    jobs = [
+        (seed + index, count, strategy, size, fleet, endgame, fleet_pool)
+        for index, count in enumerate(chunk_sizes(games, chunk))
+    ]
+    return run_jobs(run_chunk, jobs, workers, report)
+
+
+def chunk_sizes(games, chunk):
+    return [min(chunk, games - start) for start in range(0, games, chunk)]
+
+
+def run_jobs(worker, jobs, workers=None, report=None):
+    # Runs worker(job) -> SimStats over a process pool and merges the results;
+    # shared by game.sim and game.batch. Returns (stats, seconds).
+    workers = workers or os.cpu_count() or 1
+    total = SimStats()
+    started = time.perf_counter()
+    if workers == 1:
+        results = map(worker, jobs)
+        for stats in results:
+            total.merge(stats)
+            if report:
+                report(total, time.perf_counter() - started)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            for stats in pool.imap_unordered(worker, jobs):
+                total.merge(stats)
+                if report:
+                    report(total, time.perf_counter() - started)
+    return total, time.perf_counter() - started
+
+
+def print_report(stats, elapsed):
+    rate = stats.games / elapsed if elapsed > 0 else 0.0
+    print(
+        f"games={stats.games} games/s={rate:.0f} "
+        f"first_win={stats.first_win_rate():.3f} "
+        f"shots mean={stats.mean_shots():.2f} p50={stats.percentile(0.5)} p90={stats.percentile(0.9)}",
+        file=sys.stderr,
+    )
+
+
+def write_result(stats, elapsed, json_path=None):
+    out = stats.to_dict()
+    out["seconds"] = elapsed
+    out["games_per_sec"] = stats.games / elapsed if elapsed > 0 else 0.0
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(out, ensure_ascii=False, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless AI vs AI simulation")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strategy", choices=STRATEGIES, default="hunt")
+    parser.add_argument("--size", type=int, default=GRID_SIZE)
+    parser.add_argument("--fleet", type=parse_fleet, default=None)
+    parser.add_argument("--no-endgame", action="store_true", help="never switch to the exact endgame solver")
+    parser.add_argument("--fleet-pool", default=None, help="draw placements from a game.fleetpool file")
+    parser.add_argument("--json", dest="json_path", default=None)
+    args = parser.parse_args(argv)
+
+    fleet = args.fleet or default_fleet(args.size)
+    try:
+        check_fleet(fleet, args.size)
+    except ValueError as e:
+        parser.error(f"--fleet: {e}")
+    if args.fleet_pool:
+        try:
+            pool = shared_pool(args.fleet_pool)
+        except (OSError, FleetPoolError) as e:
+            parser.error(f"{args.fleet_pool}: {e}")
+        if pool.size != args.size or sorted(pool.fleet) != sorted(fleet):
+            parser.error(f"{args.fleet_pool}: pool is for size {pool.size}, fleet {pool.fleet}")
+
+    stats, elapsed = run(
+        args.games,
+        args.workers,
+        args.chunk,
+        args.seed,
+        args.strategy,
+        args.size,
+        args.fleet,
+        report=print_report,
+        endgame=not args.no_endgame,
+        fleet_pool=args.fleet_pool,
+    )
+    write_result(stats, elapsed, args.json_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+﻿import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ThinkTask:
+    # One AI move in progress. `best` is the latest candidate the strategy
+    # produced; `done` is set once the worker has stopped touching AI state.
+    def __init__(self, deadline, clock=time.monotonic):
+        self.deadline = deadline
+        self.clock = clock
+        self.best = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self.error = None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def expired(self):
+        return self.cancelled or self.clock() >= self.deadline
+
+
+class Thinker:
+    # Runs AIPlayer.iter_shots on a worker thread so the render loop never
+    # blocks on a move. Strategies yield progressively better shots; the
+    # worker stops at the first yield after the budget expires (anytime).
+    # inline: think on the caller's thread inside start(), for headless games
+    # on a timers.VirtualClock. The budget is then virtual time, which does
+    # not pass while thinking, so every move runs to completion and is ready
+    # on the frame that asked for it.
+    def __init__(self, notify=None, clock=time.monotonic, inline=False):
+        self.notify = notify
+        self.clock = clock
+        self.inline = inline
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai")
+        self.task = None
+
+    def start(self, ai, board, budget):
+        self.cancel()
+        task = ThinkTask(self.clock() + budget, self.clock)
+        self.task = task
+        if self.inline:
+            self._run(task, ai, board)
+        else:
+            self.executor.submit(self._run, task, ai, board)
+        return task
+
+    def _run(self, task, ai, board):
+        try:
+            for shot in ai.iter_shots(board, task.expired):
+                task.best = shot
+                if task.expired():
+                    break
+        except Exception as e:
+            task.error = e
+        finally:
+            task.done.set()
+            if self.notify and not task.cancelled and not self.inline:
+                self.notify()
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
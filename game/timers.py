@@ -0,0 +1,92 @@
+﻿import heapq
+import itertools
+import time
+
+
+class VirtualClock:
+    # Time source that only moves when told to, for headless runs and tests.
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def set(self, when):
+        self.now = max(self.now, when)
+
+
+class Timer:
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    # Frame clock plus a queue of delayed actions. `now` is sampled once per
+    # frame by tick(), so everything drawn or updated in a frame sees the
+    # same time. A timer without a callback only wakes the idle loop, which
+    # sleeps until next_deadline().
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.now = clock()
+        # Heap of (when, sequence, timer); cancelled timers are dropped lazily.
+        self.timers = []
+        self.counter = itertools.count()
+
+    def tick(self):
+        self.now = self.clock()
+        return self.now
+
+    def call_at(self, when, callback=None, *args):
+        timer = Timer(when, callback, args)
+        heapq.heappush(self.timers, (when, next(self.counter), timer))
+        return timer
+
+    def call_later(self, delay, callback=None, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def run_due(self):
+        # Runs every timer due at `now` in deadline order, including ones a
+        # callback schedules for a moment that has already passed.
+        while self.timers and self.timers[0][0] <= self.now:
+            timer = heapq.heappop(self.timers)[2]
+            if not timer.cancelled and timer.callback is not None:
+                timer.callback(*timer.args)
+
+    def next_deadline(self):
+        while self.timers and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)
+        return self.timers[0][0] if self.timers else None
+
+    def timeout(self, limit):
+        # Seconds the caller may sleep before the next timer, at most `limit`.
+        deadline = self.next_deadline()
+        if deadline is None:
+            return limit
+        return max(0.0, min(limit, deadline - self.now))
+
+    def advance(self, seconds, step=None):
+        # Fast-forwards a VirtualClock by `seconds`, stopping at every timer on
+        # the way; `step` runs after each stop, like one frame of a game loop.
+        end = self.now + seconds
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > end:
+                break
+            self.clock.set(deadline)
+            self.tick()
+            self.run_due()
+            if step:
+                step()
+        self.clock.set(end)
+        self.tick()
+        self.run_due()
+        if step:
+            step()
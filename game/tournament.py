@@ -0,0 +1,336 @@
+﻿import argparse
+import csv
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from itertools import combinations
+from statistics import NormalDist
+
+from .ai import PLAYER_FACTORIES, create_player
+from .board import random_fleet
+from .config import GRID_SIZE, default_fleet, parse_fleet
+from .sim import play_players
+
+DEFAULT_PLAYERS = ["hunt", "parity", "density"]
+BASE_RATING = 1500
+# Natural log-odds -> Elo points.
+ELO_SCALE = 400 / math.log(10)
+
+
+def load_plugins(modules):
+    # Plugin modules call register_player() on import; workers import them too
+    # so spawned processes see the same registry.
+    for name in modules:
+        importlib.import_module(name)
+
+
+def play_pairs(args):
+    # Mirrored pairs: both games of a pair use the same two fleets and the
+    # same opening seat, with the players swapped, so placement and coin-toss
+    # luck cancel out. Returns wins and shots-to-win per player.
+    seed, a, b, pairs, size, fleet, plugins = args
+    load_plugins(plugins)
+    random.seed(seed)
+    fleet = fleet or default_fleet(size)
+    wins = [0, 0]
+    shots = [0, 0]
+    for _ in range(pairs):
+        fleets = [random_fleet(fleet, random, size), random_fleet(fleet, random, size)]
+        for swap in (0, 1):
+            names = (b, a) if swap else (a, b)
+            players = [create_player(name, size, fleet) for name in names]
+            for player, placed in zip(players, fleets):
+                player.board.place_fleet(placed)
+            winner, count = play_players(players, 0)
+            side = winner ^ swap
+            wins[side] += 1
+            shots[side] += count
+    return a, b, wins, shots
+
+
+def _invert(matrix):
+    # Gauss-Jordan with partial pivoting; the matrices here are players x players.
+    k = len(matrix)
+    rows = [list(row) + [float(i == j) for j in range(k)] for i, row in enumerate(matrix)]
+    for col in range(k):
+        pivot = max(range(col, k), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        scale = rows[col][col]
+        rows[col] = [v / scale for v in rows[col]]
+        for r in range(k):
+            if r != col and rows[r][col]:
+                f = rows[r][col]
+                rows[r] = [v - f * p for v, p in zip(rows[r], rows[col])]
+    return [row[k:] for row in rows]
+
+
+class Standings:
+    # Head-to-head results and Bradley-Terry ratings on the Elo scale. The
+    # fit is the maximum-likelihood one over all games, so it does not depend
+    # on game order the way incremental Elo updates do.
+    def __init__(self, names, prior=1.0):
+        self.names = list(names)
+        k = len(self.names)
+        # wins[i][j]: games player i won against player j.
+        self.wins = [[0] * k for _ in range(k)]
+        self.shots = [0] * k
+        # One virtual drawn game per pairing keeps ratings finite after sweeps.
+        self.prior = prior
+
+    def add(self, i, j, wins, shots):
+        self.wins[i][j] += wins[0]
+        self.wins[j][i] += wins[1]
+        self.shots[i] += shots[0]
+        self.shots[j] += shots[1]
+
+    def games(self, i, j=None):
+        if j is not None:
+            return self.wins[i][j] + self.wins[j][i]
+        return sum(self.games(i, o) for o in range(len(self.names)) if o != i)
+
+    def won(self, i):
+        return sum(self.wins[i])
+
+    def _counts(self):
+        k = len(self.names)
+        w = [[self.wins[i][j] + self.prior / 2 if i != j else 0.0 for j in range(k)] for i in range(k)]
+        n = [[w[i][j] + w[j][i] for j in range(k)] for i in range(k)]
+        return w, n
+
+    def ratings(self, iterations=10000, tol=1e-10):
+        # Hunter's MM iterations; returns log-strengths with mean zero.
+        k = len(self.names)
+        w, n = self._counts()
+        total = [sum(row) for row in w]
+        gamma = [1.0] * k
+        for _ in range(iterations):
+            new = []
+            for i in range(k):
+                denom = sum(n[i][j] / (gamma[i] + gamma[j]) for j in range(k) if j != i)
+                new.append(total[i] / denom if denom else gamma[i])
+            mean = sum(math.log(g) for g in new) / k
+            new = [g / math.exp(mean) for g in new]
+            done = max(abs(a - b) for a, b in zip(new, gamma)) < tol
+            gamma = new
+            if done:
+                break
+        return [math.log(g) for g in gamma]
+
+    def covariance(self, r):
+        # Inverse Fisher information under the sum-zero constraint: the
+        # Hessian is a Laplacian L, and pinv(L) = inv(L + J/k) - J/k.
+        k = len(self.names)
+        _, n = self._counts()
+        h = [[0.0] * k for _ in range(k)]
+        for i in range(k):
+            for j in range(k):
+                if i != j:
+                    p = 1 / (1 + math.exp(r[j] - r[i]))
+                    h[i][j] = -n[i][j] * p * (1 - p)
+                    h[i][i] -= h[i][j]
+        inv = _invert([[h[i][j] + 1 / k for j in range(k)] for i in range(k)])
+        return [[inv[i][j] - 1 / k for j in range(k)] for i in range(k)]
+
+    def table(self, confidence=0.95):
+        # Rows sorted by rating, with a confidence interval per player.
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        r = self.ratings()
+        cov = self.covariance(r)
+        rows = []
+        for i, name in enumerate(self.names):
+            margin = z * math.sqrt(max(cov[i][i], 0.0)) * ELO_SCALE
+            rating = BASE_RATING + r[i] * ELO_SCALE
+            games = self.games(i)
+            won = self.won(i)
+            rows.append(
+                {
+                    "name": name,
+                    "rating": rating,
+                    "ci_low": rating - margin,
+                    "ci_high": rating + margin,
+                    "games": games,
+                    "wins": won,
+                    "score": won / games if games else 0.0,
+                    "mean_shots": self.shots[i] / won if won else 0.0,
+                }
+            )
+        rows.sort(key=lambda row: row["rating"], reverse=True)
+        for rank, row in enumerate(rows, 1):
+            row["rank"] = rank
+        return rows
+
+    def settled(self, confidence=0.95):
+        # True once every neighbour in the ranking is separated: the rating
+        # difference exceeds z standard errors of that difference.
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        r = self.ratings()
+        cov = self.covariance(r)
+        order = sorted(range(len(r)), key=lambda i: r[i], reverse=True)
+        for i, j in zip(order, order[1:]):
+            var = cov[i][i] + cov[j][j] - 2 * cov[i][j]
+            if r[i] - r[j] <= z * math.sqrt(max(var, 0.0)):
+                return False
+        return True
+
+    def matches(self):
+        out = []
+        for i, j in combinations(range(len(self.names)), 2):
+            out.append(
+                {
+                    "a": self.names[i],
+                    "b": self.names[j],
+                    "games": self.games(i, j),
+                    "a_wins": self.wins[i][j],
+                    "b_wins": self.wins[j][i],
+                }
+            )
+        return out
+
+
+def run(
+    names,
+    pairs=1000,
+    min_pairs=100,
+    round_pairs=100,
+    chunk=25,
+    workers=None,
+    seed=0,
+    size=GRID_SIZE,
+    fleet=None,
+    confidence=0.95,
+    plugins=(),
+    report=None,
+):
+    # Round-robin in rounds of `round_pairs` mirrored pairs per pairing,
+    # spread over a process pool in chunks. Stops at `pairs` per pairing, or
+    # earlier once the ranking is settled and `min_pairs` have been played.
+    workers = workers or os.cpu_count() or 1
+    plugins = list(plugins)
+    standings = Standings(names)
+    pairings = list(combinations(range(len(names)), 2))
+    played = 0
+    index = 0
+    settled = False
+    started = time.perf_counter()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        while played < pairs:
+            count = min(round_pairs, pairs - played)
+            # One seed per chunk keeps results reproducible regardless of scheduling.
+            jobs = []
+            for i, j in pairings:
+                left = count
+                while left > 0:
+                    step = min(chunk, left)
+                    jobs.append((seed + index, names[i], names[j], step, size, fleet, plugins))
+                    left -= step
+                    index += 1
+            results = pool.imap_unordered(play_pairs, jobs) if pool else map(play_pairs, jobs)
+            for a, b, wins, shots in results:
+                standings.add(names.index(a), names.index(b), wins, shots)
+            played += count
+            settled = standings.settled(confidence)
+            if report:
+                report(standings, played, settled, time.perf_counter() - started)
+            if settled and played >= min_pairs:
+                break
+    finally:
+        if pool:
+            pool.terminate()
+    return standings, played, settled, time.perf_counter() - started
+
+
+def print_report(standings, played, settled, elapsed):
+    rows = standings.table()
+    leader = rows[0]
+    print(
+        f"pairs={played} games={sum(r['games'] for r in rows) // 2} "
+        f"t={elapsed:.1f}s leader={leader['name']} {leader['rating']:.0f} "
+        f"settled={'yes' if settled else 'no'}",
+        file=sys.stderr,
+    )
+
+
+CSV_FIELDS = ["rank", "name", "rating", "ci_low", "ci_high", "games", "wins", "score", "mean_shots"]
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: round(v, 2) if isinstance(v, float) else v for key, v in row.items()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Round-robin tournament between AI players")
+    parser.add_argument("players", nargs="*", default=DEFAULT_PLAYERS, help="registered player names")
+    parser.add_argument("--plugin", action="append", default=[], help="module that registers extra players")
+    parser.add_argument("--list", action="store_true", help="print registered players and exit")
+    parser.add_argument("--pairs", type=int, default=1000, help="max mirrored game pairs per pairing")
+    parser.add_argument("--min-pairs", type=int, default=100, help="pairs per pairing before stopping early")
+    parser.add_argument("--round", dest="round_pairs", type=int, default=100, help="pairs per pairing per round")
+    parser.add_argument("--chunk", type=int, default=25, help="pairs per pool task")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=GRID_SIZE)
+    parser.add_argument("--fleet", type=parse_fleet, default=None)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--csv", dest="csv_path", default=None)
+    parser.add_argument("--json", dest="json_path", default=None)
+    args = parser.parse_args(argv)
+
+    load_plugins(args.plugin)
+    if args.list:
+        print("\n".join(PLAYER_FACTORIES))
+        return
+    unknown = [name for name in args.players if name not in PLAYER_FACTORIES]
+    if unknown:
+        parser.error(f"unknown players: {', '.join(unknown)}")
+    if len(set(args.players)) < 2:
+        parser.error("need at least two different players")
+
+    standings, played, settled, elapsed = run(
+        list(dict.fromkeys(args.players)),
+        args.pairs,
+        args.min_pairs,
+        args.round_pairs,
+        args.chunk,
+        args.workers,
+        args.seed,
+        args.size,
+        args.fleet,
+        args.confidence,
+        args.plugin,
+        report=print_report,
+    )
+    rows = standings.table(args.confidence)
+    out = {
+        "confidence": args.confidence,
+        "pairs_per_pairing": played,
+        "settled": settled,
+        "seconds": elapsed,
+        "players": rows,
+        "matches": standings.matches(),
+    }
+    if args.csv_path:
+        write_csv(args.csv_path, rows)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+    if not args.csv_path and not args.json_path:
+        for row in rows:
+            print(
+                f"{row['rank']:>2} {row['name']:<20} {row['rating']:7.1f} "
+                f"[{row['ci_low']:.1f}, {row['ci_high']:.1f}] "
+                f"games={row['games']} score={row['score']:.3f} shots={row['mean_shots']:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
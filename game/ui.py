@@ -1,10 +1,15 @@
-﻿import pygame
+﻿import os
+from collections import OrderedDict
+
+import pygame
+
+from .config import GRID_SIZE, DATA_DIR
 
 # ---------------------------
 # Config
 # ---------------------------
-GRID_SIZE = 10
 CELL_SIZE = 30
+MIN_CELL_SIZE = 3
 BOARD_SIZE = GRID_SIZE * CELL_SIZE
 MARGIN = 20
 GAP = 40
@@ -13,8 +18,11 @@ TOP = 80
 SCREEN_WIDTH = MARGIN * 2 + BOARD_SIZE * 2 + GAP
 SCREEN_HEIGHT = TOP + BOARD_SIZE + MARGIN + 140
 FPS = 60
+IDLE_MAX_WAIT = 1.0
 
-RECORDS_FILE = "records.json"
+RECORDS_FILE = os.path.join(DATA_DIR, "records.db")
+SOUND_CACHE_DIR = os.path.join(DATA_DIR, "sound_cache")
+REPLAY_DIR = os.path.join(DATA_DIR, "replays")
 
 WHITE = (17, 18, 22)
 BLACK = (228, 231, 236)
@@ -30,6 +38,52 @@ BG_RIGHT = (19, 20, 24)
 BG_DIVIDER = (44, 46, 52)
 
 
+class TextCache:
+    # LRU of rendered text surfaces keyed by (font, text, antialias, colour).
+    def __init__(self, max_entries=512, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color):
+        key = (font, text, antialias, tuple(color))
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surf
+
+        self.misses += 1
+        surf = font.render(text, antialias, color)
+        self.entries[key] = surf
+        self.bytes += self._size(surf)
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= self._size(old)
+        return surf
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def _size(surf):
+        return surf.get_pitch() * surf.get_height()
+
+
+text_cache = TextCache()
+
+
+def render_text(font, text, color, antialias=True):
+    return text_cache.render(font, text, antialias, color)
+
+
 class Button:
     def __init__(self, rect, text, font, bg=GRAY, fg=BLACK):
         self.rect = pygame.Rect(rect)
@@ -44,7 +98,7 @@ class Button:
             color = LIGHT_GRAY
         pygame.draw.rect(surface, color, self.rect, border_radius=8)
         pygame.draw.rect(surface, DARK, self.rect, 2, border_radius=8)
-        text_surf = self.font.render(self.text, True, self.fg)
+        text_surf = render_text(self.font, self.text, self.fg)
         text_rect = text_surf.get_rect(center=self.rect.center)
         surface.blit(text_surf, text_rect)
 
@@ -1,5 +1,40 @@
-﻿from game.core import Game
+﻿import argparse
+
+from game.board import check_fleet
+from game.config import GRID_SIZE, MAX_GRID_SIZE, default_fleet, parse_fleet
+from game.core import Game
+from game.net import parse_address
+from game.replay import ReplayError
 
 
 if __name__ == "__main__":
-    Game().run()
+    parser = argparse.ArgumentParser(description="Морской бой")
+    parser.add_argument("--size", type=int, default=GRID_SIZE, help=f"сторона поля, до {MAX_GRID_SIZE}")
+    parser.add_argument("--fleet", type=parse_fleet, default=None, help="размеры кораблей через запятую, например 5,4,4,3")
+    parser.add_argument("--perf", action="store_true", help="показать оверлей времени кадра (переключается F3)")
+    parser.add_argument("--perf-trace", default=None, help="записывать время каждого кадра в CSV-файл")
+    parser.add_argument("--no-record", action="store_true", help="не записывать партии в replays/")
+    parser.add_argument("--replay", default=None, help="воспроизвести записанную партию (.sbr)")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="скорость воспроизведения")
+    parser.add_argument("--connect", default=None, help="играть через сервер host:port (python -m game.net serve)")
+    parser.add_argument("--vs", choices=["ai", "human"], default="ai", help="соперник в сетевой игре")
+    parser.add_argument("--join", type=int, default=None, help="присоединиться к открытому матчу по номеру")
+    args = parser.parse_args()
+    if not 1 <= args.size <= MAX_GRID_SIZE:
+        parser.error(f"--size must be between 1 and {MAX_GRID_SIZE}")
+    try:
+        check_fleet(args.fleet or default_fleet(args.size), args.size)
+    except ValueError as e:
+        parser.error(f"--fleet: {e}")
+    game = Game(args.size, args.fleet, perf_overlay=args.perf, perf_trace=args.perf_trace, record=not args.no_record)
+    if args.replay:
+        try:
+            game.start_replay(args.replay, args.replay_speed)
+        except (OSError, ReplayError) as e:
+            parser.error(f"cannot replay {args.replay}: {e}")
+    elif args.connect:
+        try:
+            game.start_network(*parse_address(args.connect), mode=args.vs, join=args.join)
+        except OSError as e:
+            parser.error(f"cannot connect to {args.connect}: {e}")
+    game.run()
@@ -0,0 +1,63 @@
+import random
+
+from game.ai import AIPlayer, EndgameSolver
+from game.board import Board, iter_bits, placement_table, random_fleet
+
+
+def brute_force(n, free, hits, sizes):
+    # Every set of non-touching placements inside `free` that covers `hits`.
+    configs = set()
+
+    def place(i, used, halo, masks):
+        if i == len(sizes):
+            if not hits & ~used:
+                configs.add(frozenset(masks))
+            return
+        for _, mask, ship_halo in placement_table(sizes[i], n):
+            if not mask & ~free and not mask & halo:
+                place(i + 1, used | mask, halo | ship_halo, masks + [mask])
+
+    place(0, 0, 0, [])
+    occupancy = [0] * (n * n)
+    for config in configs:
+        for mask in config:
+            for idx in iter_bits(mask):
+                occupancy[idx] += 1
+    return len(configs), occupancy
+
+
+def test_solver_matches_brute_force():
+    rng = random.Random(1)
+    n = 5
+    field = (1 << EndgameSolver.FIELD) - 1
+    for _ in range(60):
+        sizes = rng.choice([[3, 2], [2, 2, 1], [3, 1, 1], [2, 1, 1]])
+        ships = 0
+        for _, mask, _ in random_fleet(sizes, rng, n):
+            ships |= mask
+        shot = 0
+        for idx in rng.sample(range(n * n), rng.randrange(n * n)):
+            shot |= 1 << idx
+        hits = shot & ships
+        free = ((1 << (n * n)) - 1) & ~(shot & ~ships)
+
+        solver = EndgameSolver(n, threshold=10**9)
+        count, occ = solver.probabilities(free, hits, sizes)
+        expected_count, expected_occ = brute_force(n, free, hits, sizes)
+        assert count == expected_count
+        assert [(occ >> (EndgameSolver.FIELD * idx)) & field for idx in range(n * n)] == expected_occ
+
+
+def test_tracked_fits_match_scan():
+    random.seed(2)
+    for _ in range(20):
+        ai = AIPlayer("hunt", 6, [3, 2, 2, 1])
+        board = Board(6, [3, 2, 2, 1])
+        board.place_ships_auto()
+        while not board.all_sunk():
+            x, y = ai.choose_shot(board)
+            ai.process_result((x, y), board.shoot(x, y), board)
+            solver = ai.endgame
+            for size in ai.remaining:
+                if solver.free is not None:
+                    assert solver.fits[size] == solver._fitting(solver.free, size).count(1)
@@ -0,0 +1,32 @@
+import random
+
+from game.ai import EndgameSolver
+from game.board import random_fleet
+from game.montecarlo import sample_counts
+
+
+def test_weighted_samples_match_exact_probabilities():
+    rng = random.Random(4)
+    n = 5
+    sizes = [3, 2, 1, 1]
+    field = (1 << EndgameSolver.FIELD) - 1
+    for seed in range(3):
+        ships = 0
+        for _, mask, _ in random_fleet(sizes, rng, n):
+            ships |= mask
+        shot = 0
+        for idx in rng.sample(range(n * n), 8):
+            shot |= 1 << idx
+        hits = shot & ships
+        misses = shot & ~ships
+        free = ((1 << (n * n)) - 1) & ~misses
+
+        count, occ = EndgameSolver(n, threshold=10**9).probabilities(free, hits, sizes)
+        counts, done = sample_counts((n, misses, hits, sizes, 20000, seed))
+        assert done == 20000
+        # Every sample places the same number of ship cells off the hits.
+        total = sum(counts) / (sum(sizes) - bin(hits).count("1"))
+        for idx in range(n * n):
+            if not hits >> idx & 1:
+                exact = ((occ >> (EndgameSolver.FIELD * idx)) & field) / count
+                assert abs(counts[idx] / total - exact) < 0.03